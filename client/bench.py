@@ -0,0 +1,151 @@
+"""
+Headless benchmark for the client collision/physics core.
+
+    python -m client.bench --statics 400 --circles 100 --players 50 --ticks 1200
+    python -m client.bench --rate 30 --continuous
+
+Reports ticks/second, narrowphase collide() calls per tick and memory allocated per tick. With --min-tps the run exits
+non-zero when throughput falls below the given rate, so it can gate regressions in the 120 Hz update loop.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from client import headless
+
+headless.enable()
+
+from collision import Vector  # noqa: E402
+
+from client.headless import Image, key  # noqa: E402
+from client.logic import Collidable, Player  # noqa: E402
+from client.profiler import FrameProfiler  # noqa: E402
+from client.simulation import Simulation  # noqa: E402
+
+WINDOW_WIDTH = 1920
+WINDOW_HEIGHT = 1080
+TICK = 1 / 120
+
+
+def populate(simulation: Simulation, statics: int, circles: int, players: int, seed: int = 0,
+             continuous: bool = False) -> [Player]:
+    """
+    Fills a simulation with static polygon walls, static circles and moving players at random positions.
+    :param continuous: whether the players use continuous collision.
+    :return: the players, so their keys can be driven.
+    """
+    rng = random.Random(seed)
+    tile = Image(32, 32)
+    size = {'window_width': WINDOW_WIDTH, 'window_height': WINDOW_HEIGHT}
+    for _ in range(statics):
+        simulation.add(Collidable(rel_pos_vector=Vector(rng.uniform(0, 16), rng.uniform(0, 9)), img=tile, **size))
+    for _ in range(circles):
+        simulation.add(Collidable(rel_pos_vector=Vector(rng.uniform(0, 16), rng.uniform(0, 9)), img=tile,
+                                  radius=rng.uniform(0.1, 0.4), **size))
+    result = []
+    for _ in range(players):
+        player = Player(rel_pos_vector=Vector(rng.uniform(0, 16), rng.uniform(0, 9)), img=tile,
+                        continuous=continuous, **size)
+        simulation.add(player)
+        result.append(player)
+    return result
+
+
+def steer(players: [Player], rng: random.Random):
+    """
+    Presses a random set of movement keys for every player.
+    """
+    for player in players:
+        handler = player.key_handler
+        for symbol in (key.W, key.A, key.S, key.D):
+            handler[symbol] = rng.random() < 0.5
+
+
+def run(statics: int, circles: int, players: int, ticks: int, seed: int = 0, phases: bool = False,
+        rate: float = 120, continuous: bool = False) -> dict:
+    """
+    Runs one benchmark scenario and gives its measurements.
+    :param phases: also time each phase of the tick with a FrameProfiler, at some cost to ticks/second.
+    :param rate: simulation ticks per simulated second.
+    :param continuous: whether the players use continuous collision.
+    """
+    tick_length = 1 / rate
+    simulation = Simulation(WINDOW_WIDTH, WINDOW_HEIGHT)
+    if phases:
+        simulation.profiler = FrameProfiler(window=ticks)
+    moving = populate(simulation, statics, circles, players, seed, continuous)
+    rng = random.Random(seed)
+
+    collide_calls = 0
+    start = time.perf_counter()
+    for tick in range(ticks):
+        if tick % 30 == 0:
+            steer(moving, rng)
+        simulation.step(tick_length)
+        collide_calls += simulation.collision_checks
+        if phases:
+            simulation.profiler.end_frame()
+    elapsed = time.perf_counter() - start
+
+    # Allocation pass, kept separate so tracing doesn't skew the timings above.
+    profiler, simulation.profiler = simulation.profiler, None
+    sampled = min(ticks, 120)
+    allocated = 0
+    tracemalloc.start()
+    for tick in range(sampled):
+        if tick % 30 == 0:
+            steer(moving, rng)
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        simulation.step(tick_length)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    result = {
+        'bodies': statics + circles + players,
+        'ticks': ticks,
+        'ticks_per_second': ticks / elapsed if elapsed else float('inf'),
+        'collide_calls_per_tick': collide_calls / ticks if ticks else 0,
+        'bytes_allocated_per_tick': allocated / sampled if sampled else 0,
+    }
+    if profiler:
+        result['phase_percentiles_ms'] = profiler.report()
+    return result
+
+
+def main(argv: [str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmarks the client collision/physics core without a window.')
+    parser.add_argument('--statics', type=int, default=400, help='number of static polygon walls')
+    parser.add_argument('--circles', type=int, default=100, help='number of static circles')
+    parser.add_argument('--players', type=int, default=50, help='number of moving players')
+    parser.add_argument('--ticks', type=int, default=1200, help='number of ticks to run')
+    parser.add_argument('--rate', type=float, default=1 / TICK, help='simulation ticks per simulated second')
+    parser.add_argument('--continuous', action='store_true', help='give the players continuous collision')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--phases', action='store_true', help='break tick time down by phase')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--min-tps', type=float, default=None, help='fail if ticks/second drops below this')
+    args = parser.parse_args(argv)
+
+    result = run(args.statics, args.circles, args.players, args.ticks, args.seed, args.phases, args.rate,
+                 args.continuous)
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(f'{result["bodies"]} bodies, {result["ticks"]} ticks')
+        print(f'  ticks/second:         {result["ticks_per_second"]:.1f}')
+        print(f'  collide() calls/tick: {result["collide_calls_per_tick"]:.1f}')
+        print(f'  bytes allocated/tick: {result["bytes_allocated_per_tick"]:.0f}')
+        for phase, (p50, p95, p99) in sorted(result.get('phase_percentiles_ms', {}).items()):
+            print(f'  {phase:<12} p50 {p50:.3f} ms, p95 {p95:.3f} ms, p99 {p99:.3f} ms')
+    if args.min_tps is not None and result['ticks_per_second'] < args.min_tps:
+        print(f'Regression: {result["ticks_per_second"]:.1f} ticks/second is below {args.min_tps}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
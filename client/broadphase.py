@@ -0,0 +1,147 @@
+from typing import Iterator, Tuple
+
+Cell = Tuple[int, int]
+
+
+class SpatialHash:
+    """
+    A persistent broadphase that buckets Collidables by the (column, row) grid cells they cover.
+    Buckets live between frames, so a body is only moved between buckets when its cells change.
+    Buckets are dicts used as ordered sets, so pairs come out in the same order on every run and replays match.
+    """
+
+    def __init__(self):
+        self._buckets: {Cell: {object: None}} = {}
+        self._cells: {object: frozenset} = {}
+        self._order: {object: int} = {}
+        self._next_order = 0
+
+    def __len__(self):
+        return len(self._cells)
+
+    def __contains__(self, collidable):
+        return collidable in self._cells
+
+    def insert(self, collidable):
+        """
+        Adds a Collidable to the hash, bucketing it by its current cells. Inserting twice does nothing.
+        """
+        if collidable in self._cells:
+            return
+        self._order[collidable] = self._next_order
+        self._next_order += 1
+        cells = collidable.cells
+        self._cells[collidable] = cells
+        for cell in cells:
+            self._bucket(cell)[collidable] = None
+
+    def remove(self, collidable):
+        """
+        Removes a Collidable from every bucket it occupies.
+        """
+        cells = self._cells.pop(collidable, None)
+        if cells is None:
+            return
+        del self._order[collidable]
+        for cell in cells:
+            self._discard(cell, collidable)
+
+    def update(self, collidable) -> bool:
+        """
+        Re-buckets a Collidable that may have moved. Collidable.cells is cached, so a body that stayed still
+        hands back the same frozenset and costs a single identity check.
+        :return: True if the cells the Collidable covers changed.
+        """
+        old = self._cells.get(collidable)
+        if old is None:
+            self.insert(collidable)
+            return True
+        new = collidable.cells
+        if new is old or new == old:
+            return False
+        for cell in old - new:
+            self._discard(cell, collidable)
+        for cell in new - old:
+            self._bucket(cell)[collidable] = None
+        self._cells[collidable] = new
+        return True
+
+    def query(self, cells) -> {object}:
+        """
+        Gives every Collidable that occupies at least one of the given cells.
+        """
+        result = set()
+        for cell in cells:
+            bucket = self._buckets.get(cell)
+            if bucket:
+                result.update(bucket)
+        return result
+
+    def pairs(self) -> Iterator[Tuple[object, object]]:
+        """
+        Yields each unordered pair of Collidables that share at least one cell exactly once.
+        A Collidable is never paired with itself.
+        """
+        order = self._order
+        for collidable, cells in self._cells.items():
+            rank = order[collidable]
+            seen = set()
+            for cell in cells:
+                for other in self._buckets[cell]:
+                    if order[other] > rank and other not in seen:
+                        seen.add(other)
+                        yield collidable, other
+
+    def clear(self):
+        self._buckets.clear()
+        self._cells.clear()
+        self._order.clear()
+
+    def _bucket(self, cell: Cell) -> {object: None}:
+        bucket = self._buckets.get(cell)
+        if bucket is None:
+            bucket = self._buckets[cell] = {}
+        return bucket
+
+    def _discard(self, cell: Cell, collidable):
+        bucket = self._buckets[cell]
+        bucket.pop(collidable, None)
+        if not bucket:
+            del self._buckets[cell]
+
+
+class StaticIndex:
+    """
+    An immutable grid of Collidables that never move, such as level geometry. Built once when the level (or a chunk of
+    it) loads and only queried afterwards, so static-vs-static pairs are never generated.
+    """
+
+    def __init__(self, collidables=()):
+        buckets: {Cell: list} = {}
+        for collidable in collidables:
+            for cell in collidable.cells:
+                bucket = buckets.get(cell)
+                if bucket is None:
+                    bucket = buckets[cell] = []
+                bucket.append(collidable)
+        self._buckets: {Cell: tuple} = {cell: tuple(bucket) for cell, bucket in buckets.items()}
+        self._size = len(collidables)
+
+    def __len__(self):
+        return self._size
+
+    def candidates(self, cells) -> Iterator[object]:
+        """
+        Yields each static Collidable occupying at least one of the given cells once, in a stable order.
+        """
+        buckets = self._buckets
+        if len(cells) == 1:
+            for cell in cells:
+                yield from buckets.get(cell, ())
+            return
+        seen = set()
+        for cell in cells:
+            for collidable in buckets.get(cell, ()):
+                if collidable not in seen:
+                    seen.add(collidable)
+                    yield collidable
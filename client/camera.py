@@ -0,0 +1,171 @@
+from client import headless
+from client.logic import Asset, Collidable
+
+if not headless.ENABLED:
+    from pyglet import gl
+
+Cell = (int, int)
+
+
+class Camera:
+    """
+    A window sized view onto a world that is larger than one screen, in the same relative coordinates as Assets
+    (16 by 9 to a screen).
+    Sprites keep their world positions in pixels and the whole batch is shifted by the camera's offset when drawn,
+    so scrolling never touches a sprite. The offset is worked out only when the camera moves.
+    Tracked sprites outside the view are detached from the batch and attached again when they come into view, so
+    drawing costs as much as what is on screen whatever the size of the level. What is in view is found from the
+    collision grid cells the view covers, in the simulation's broadphase and in the camera's own grid for scenery
+    that doesn't collide.
+    """
+
+    def __init__(self, window_width: int, window_height: int, batch=None, margin: float = 0.5):
+        """
+        :param window_width: width of the window the camera draws into.
+        :param window_height: height of the window the camera draws into.
+        :param batch: the batch tracked sprites are drawn in.
+        :param margin: relative distance past the edges of the view that sprites are still drawn for, so large
+        sprites don't pop in at the edges.
+        """
+        self.window_width = window_width
+        self.window_height = window_height
+        self.batch = batch
+        self.margin = margin
+        self.rel_x = 0.0  # bottom left corner of the view
+        self.rel_y = 0.0
+        self._offset = (0, 0)
+        self._view_cells: frozenset = None
+        self._tracked: {Asset: None} = {}
+        self._shown: {Asset: None} = {}  # tracked sprites that are attached to the batch
+        self._scenery: {Cell: {Asset}} = {}
+        self._scenery_cells: {Asset: frozenset} = {}
+
+    @property
+    def offset(self) -> (int, int):
+        """
+        The pixel translation from world to screen.
+        """
+        return self._offset
+
+    @property
+    def view(self) -> ((float, float), (float, float)):
+        """
+        The part of the world in view as ((min_x, min_y), (max_x, max_y)) in relative coordinates.
+        """
+        return (self.rel_x, self.rel_y), (self.rel_x + 16, self.rel_y + 9)
+
+    @property
+    def view_cells(self) -> frozenset:
+        """
+        Every (column, row) collision grid cell the view and its margin cover. Cached until the camera moves.
+        """
+        if self._view_cells is None:
+            margin = self.margin
+            self._view_cells = Collidable.cells_of((self.rel_x - margin, self.rel_y - margin),
+                                                   (self.rel_x + 16 + margin, self.rel_y + 9 + margin))
+        return self._view_cells
+
+    def move_to(self, rel_x: float, rel_y: float):
+        """
+        Puts the bottom left corner of the view at a point in relative coordinates.
+        """
+        if rel_x == self.rel_x and rel_y == self.rel_y:
+            return
+        self.rel_x = rel_x
+        self.rel_y = rel_y
+        # Whole pixels, so that tiles stay aligned to the screen instead of shimmering as the camera scrolls.
+        self._offset = (int(rel_x * self.window_width / 16), int(rel_y * self.window_height / 9))
+        self._view_cells = None
+
+    def follow(self, rel_x: float, rel_y: float):
+        """
+        Centers the view on a point in relative coordinates.
+        """
+        self.move_to(rel_x - 8, rel_y - 4.5)
+
+    def world_to_screen(self, rel_x: float, rel_y: float) -> (int, int):
+        return (int(rel_x * self.window_width / 16) - self._offset[0],
+                int(rel_y * self.window_height / 9) - self._offset[1])
+
+    def screen_to_world(self, x: int, y: int) -> (float, float):
+        return (x + self._offset[0]) * 16 / self.window_width, (y + self._offset[1]) * 9 / self.window_height
+
+    def track(self, asset: Asset):
+        """
+        Starts culling an Asset's sprite. Collidables are found through the simulation given to cull, anything else is
+        kept in the camera's own grid and is expected not to move.
+        """
+        if asset in self._tracked:
+            return
+        self._tracked[asset] = None
+        if asset.batch is not None:
+            self._shown[asset] = None
+        if not isinstance(asset, Collidable):
+            cells = Collidable.cells_of(*self._bounds(asset))
+            self._scenery_cells[asset] = cells
+            for cell in cells:
+                bucket = self._scenery.get(cell)
+                if bucket is None:
+                    bucket = self._scenery[cell] = set()
+                bucket.add(asset)
+
+    def forget(self, asset: Asset):
+        """
+        Stops culling an Asset, leaving its sprite attached to or detached from the batch as it is.
+        """
+        if asset not in self._tracked:
+            return
+        del self._tracked[asset]
+        self._shown.pop(asset, None)
+        for cell in self._scenery_cells.pop(asset, ()):
+            bucket = self._scenery[cell]
+            bucket.discard(asset)
+            if not bucket:
+                del self._scenery[cell]
+
+    def cull(self, simulation=None) -> int:
+        """
+        Attaches the tracked sprites in view to the batch and detaches the ones that left it. Only sprites whose
+        visibility changed since the last call are touched.
+        :param simulation: the Simulation whose broadphase the tracked Collidables are found in.
+        :return: number of tracked sprites in view.
+        """
+        cells = self.view_cells
+        scenery = self._scenery
+        in_view = set()
+        for cell in cells:
+            bucket = scenery.get(cell)
+            if bucket:
+                in_view |= bucket
+        if simulation:
+            in_view |= simulation.query(cells)
+        tracked = self._tracked
+        shown = self._shown
+        batch = self.batch
+        for asset in [asset for asset in shown if asset not in in_view]:
+            del shown[asset]
+            asset.batch = None
+        for asset in in_view:
+            if asset not in shown and asset in tracked:
+                shown[asset] = None
+                asset.batch = batch
+        return len(shown)
+
+    def apply(self):
+        """
+        Shifts everything drawn until restore by the camera's offset.
+        """
+        if not headless.ENABLED:
+            gl.glPushMatrix()
+            gl.glTranslatef(-self._offset[0], -self._offset[1], 0)
+
+    def restore(self):
+        if not headless.ENABLED:
+            gl.glPopMatrix()
+
+    def _bounds(self, asset: Asset) -> ((float, float), (float, float)):
+        # Sprites are anchored at their centers.
+        half_width = asset.width * 16 / self.window_width / 2
+        half_height = asset.height * 9 / self.window_height / 2
+        return ((asset.rel_x - half_width, asset.rel_y - half_height),
+                (asset.rel_x + half_width, asset.rel_y + half_height))
@@ -0,0 +1,207 @@
+"""
+Compact collider storage and a SAT narrowphase that runs directly on it.
+
+Every collider shape is a small __slots__ record. Its vertices and edge normals live in array buffers shared by all
+shapes in a ColliderStore, stored relative to the shape's position, so moving a body never touches its vertex data.
+"""
+from array import array
+from math import inf, sqrt
+
+from collision import Response, Vector
+
+POINT = 0
+CIRCLE = 1
+POLY = 2
+
+
+class Shape:
+    """
+    One collider in a ColliderStore. pos is shared with the owning Collidable, so the shape follows it for free.
+    """
+
+    __slots__ = ('store', 'kind', 'pos', 'offset', 'count', 'radius', 'min_x', 'min_y', 'max_x', 'max_y')
+
+    def __init__(self, store, kind: int, pos: Vector, offset: int, count: int, radius: float,
+                 bounds: (float, float, float, float)):
+        self.store = store
+        self.kind = kind
+        self.pos = pos
+        self.offset = offset
+        self.count = count
+        self.radius = radius
+        self.min_x, self.min_y, self.max_x, self.max_y = bounds
+
+    def hull_offsets(self) -> [(float, float)]:
+        """
+        Offsets from pos of points whose bounding box is the shape's bounding box.
+        """
+        if self.kind == CIRCLE:
+            return [(self.min_x, self.min_y), (self.max_x, self.max_y)]
+        vertices = self.store.vertices
+        start = self.offset * 2
+        return [(vertices[i], vertices[i + 1]) for i in range(start, start + self.count * 2, 2)]
+
+
+class ColliderStore:
+    """
+    Shared vertex and normal buffers for many Shapes. Space freed by released shapes is reused by shapes with the same
+    number of vertices.
+    """
+
+    def __init__(self):
+        self.vertices = array('d')
+        self.normals = array('d')
+        self._live = 0
+        self._free: {int: [int]} = {}
+
+    def __len__(self):
+        return self._live
+
+    def point(self, pos: Vector) -> Shape:
+        return Shape(self, POINT, pos, self._allocate(((0.0, 0.0),)), 1, 0.0, (0.0, 0.0, 0.0, 0.0))
+
+    def circle(self, pos: Vector, radius: float) -> Shape:
+        return Shape(self, CIRCLE, pos, self._allocate(((0.0, 0.0),)), 1, radius, (-radius, -radius, radius, radius))
+
+    def poly(self, pos: Vector, points) -> Shape:
+        """
+        :param points: the convex polygon's vertices relative to pos, in either winding order.
+        """
+        points = [(float(point[0]), float(point[1])) for point in points]
+        xs = [x for x, _ in points]
+        ys = [y for _, y in points]
+        return Shape(self, POLY, pos, self._allocate(points), len(points), 0.0, (min(xs), min(ys), max(xs), max(ys)))
+
+    def release(self, shape: Shape):
+        """
+        Frees a shape's space in the buffers. The shape must not be used afterwards.
+        """
+        if shape.store is not self:
+            return
+        self._free.setdefault(shape.count, []).append(shape.offset)
+        shape.store = None
+        self._live -= 1
+
+    def _allocate(self, points: [(float, float)]) -> int:
+        count = len(points)
+        free = self._free.get(count)
+        if free:
+            offset = free.pop()
+        else:
+            offset = len(self.vertices) // 2
+            self.vertices.extend([0.0] * count * 2)
+            self.normals.extend([0.0] * count * 2)
+        vertices, normals = self.vertices, self.normals
+        for i, (x, y) in enumerate(points):
+            next_x, next_y = points[(i + 1) % count]
+            edge_x, edge_y = next_x - x, next_y - y
+            length = sqrt(edge_x * edge_x + edge_y * edge_y) or 1.0
+            j = (offset + i) * 2
+            vertices[j] = x
+            vertices[j + 1] = y
+            normals[j] = edge_y / length
+            normals[j + 1] = -edge_x / length
+        self._live += 1
+        return offset
+
+
+shapes = ColliderStore()  # the store Collidables put their colliders in
+
+
+def _project(shape: Shape, axis_x: float, axis_y: float) -> (float, float):
+    """
+    Projects a shape, at its current position, onto an axis.
+    """
+    center = shape.pos.x * axis_x + shape.pos.y * axis_y
+    if shape.kind != POLY:
+        return center - shape.radius, center + shape.radius
+    vertices = shape.store.vertices
+    start = shape.offset * 2
+    low = high = vertices[start] * axis_x + vertices[start + 1] * axis_y
+    for i in range(start + 2, start + shape.count * 2, 2):
+        dot = vertices[i] * axis_x + vertices[i + 1] * axis_y
+        if dot < low:
+            low = dot
+        elif dot > high:
+            high = dot
+    return center + low, center + high
+
+
+def _closest_vertex_axis(poly: Shape, x: float, y: float) -> (float, float):
+    """
+    The unit axis from a polygon's nearest vertex to a point, used as the extra SAT axis against circles.
+    """
+    vertices = poly.store.vertices
+    start = poly.offset * 2
+    best = inf
+    axis_x = axis_y = 0.0
+    for i in range(start, start + poly.count * 2, 2):
+        dx = x - (poly.pos.x + vertices[i])
+        dy = y - (poly.pos.y + vertices[i + 1])
+        distance = dx * dx + dy * dy
+        if distance < best:
+            best, axis_x, axis_y = distance, dx, dy
+    length = sqrt(best)
+    return (axis_x / length, axis_y / length) if length else (0.0, 1.0)
+
+
+def collide(a: Shape, b: Shape) -> Response:
+    """
+    Tests two shapes for overlap with the separating axis theorem.
+    :return: a collision.Response if they overlap, else None. overlap_v is the shortest vector that, subtracted from
+    a's position, separates the two.
+    """
+    if a.pos.x + a.max_x < b.pos.x + b.min_x or b.pos.x + b.max_x < a.pos.x + a.min_x or \
+            a.pos.y + a.max_y < b.pos.y + b.min_y or b.pos.y + b.max_y < a.pos.y + a.min_y:
+        return None
+
+    if a.kind != POLY and b.kind != POLY:
+        # Points are circles of radius 0.
+        dx, dy = b.pos.x - a.pos.x, b.pos.y - a.pos.y
+        total = a.radius + b.radius
+        distance_sq = dx * dx + dy * dy
+        if distance_sq > total * total:
+            return None
+        distance = sqrt(distance_sq)
+        axes = [(dx / distance, dy / distance) if distance else (0.0, 1.0)]
+    else:
+        axes = []
+        for shape in (a, b):
+            if shape.kind == POLY:
+                normals = shape.store.normals
+                start = shape.offset * 2
+                axes.extend((normals[i], normals[i + 1]) for i in range(start, start + shape.count * 2, 2))
+        if a.kind == CIRCLE:
+            axes.append(_closest_vertex_axis(b, a.pos.x, a.pos.y))
+        elif b.kind == CIRCLE:
+            axes.append(_closest_vertex_axis(a, b.pos.x, b.pos.y))
+
+    overlap = inf
+    normal_x = normal_y = 0.0
+    a_in_b = b_in_a = True
+    for axis_x, axis_y in axes:
+        a_low, a_high = _project(a, axis_x, axis_y)
+        b_low, b_high = _project(b, axis_x, axis_y)
+        if a_low > b_high or b_low > a_high:
+            return None
+        if a_low < b_low or a_high > b_high:
+            a_in_b = False
+        if b_low < a_low or b_high > a_high:
+            b_in_a = False
+        forward = a_high - b_low  # push a back along the axis
+        backward = b_high - a_low  # push a forward along the axis
+        if forward <= backward:
+            if forward < overlap:
+                overlap, normal_x, normal_y = forward, axis_x, axis_y
+        elif backward < overlap:
+            overlap, normal_x, normal_y = backward, -axis_x, -axis_y
+
+    response = Response()
+    response.a = a
+    response.b = b
+    response.overlap = overlap
+    response.overlap_n = Vector(normal_x, normal_y)
+    response.overlap_v = Vector(normal_x * overlap, normal_y * overlap)
+    response.a_in_b = a_in_b
+    response.b_in_a = b_in_a
+    return response
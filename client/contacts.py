@@ -0,0 +1,109 @@
+from collision import Response
+
+from client.logic import Collidable, PhysicsBody
+
+
+class ContactManager:
+    """
+    Tracks which pairs of Collidables are touching from one tick to the next, so gameplay code hears about contacts
+    starting and ending instead of being told about every overlap on every tick.
+    Listeners are called with (collidable, collidable2, response) when a pair starts touching (begin) and on every
+    later tick it still touches (persist), and with (collidable, collidable2) on the first tick it doesn't (end).
+    Touching PhysicsBodies are also pushed apart, each by a share of the overlap inversely proportional to its mass.
+    The pushes are summed over the tick and applied together at its end.
+    """
+
+    def __init__(self, separate: bool = True):
+        """
+        :param separate: whether to push overlapping bodies apart.
+        """
+        self.separate = separate
+        self.on_begin: [callable] = []
+        self.on_persist: [callable] = []
+        self.on_end: [callable] = []
+        self.touching: {(Collidable, Collidable): None} = {}  # pairs touching as of the last finished tick
+        self._current: {(Collidable, Collidable): None} = {}
+        self._offsets: {PhysicsBody: [float, float]} = {}
+
+    def __len__(self):
+        return len(self.touching)
+
+    def register(self, on_begin: callable = None, on_persist: callable = None, on_end: callable = None):
+        """
+        Adds listeners for any of the contact events.
+        """
+        if on_begin:
+            self.on_begin.append(on_begin)
+        if on_persist:
+            self.on_persist.append(on_persist)
+        if on_end:
+            self.on_end.append(on_end)
+
+    def contact(self, collidable: Collidable, collidable2: Collidable, response: Response):
+        """
+        Records that a pair overlaps this tick, emits begin or persist and separates them.
+        """
+        key = (collidable, collidable2) if id(collidable) < id(collidable2) else (collidable2, collidable)
+        self._current[key] = None
+        if key in self.touching:
+            for listener in self.on_persist:
+                listener(collidable, collidable2, response)
+        else:
+            for listener in self.on_begin:
+                listener(collidable, collidable2, response)
+        if self.separate:
+            self._separate(collidable, collidable2, response)
+
+    def end_tick(self):
+        """
+        Applies this tick's separation, emits end for every pair that touched last tick but not this one, and starts a
+        new tick.
+        """
+        if self._offsets:
+            worlds = {}
+            for body, offset in self._offsets.items():
+                worlds.setdefault(body.world, {})[body] = offset
+            for world, offsets in worlds.items():
+                world.nudge(offsets)
+            self._offsets = {}
+        if self.on_end:
+            current = self._current
+            for collidable, collidable2 in self.touching:
+                if (collidable, collidable2) not in current:
+                    for listener in self.on_end:
+                        listener(collidable, collidable2)
+        self.touching = self._current
+        self._current = {}
+
+    def forget(self, collidable: Collidable):
+        """
+        Drops a Collidable's contacts without emitting end, for when it is removed from the simulation.
+        """
+        self.touching = {pair: None for pair in self.touching if collidable not in pair}
+        self._current = {pair: None for pair in self._current if collidable not in pair}
+        self._offsets.pop(collidable, None)
+
+    def _separate(self, collidable: Collidable, collidable2: Collidable, response: Response):
+        # Subtracting overlap_v from the first collidable's position separates the pair. Static Collidables don't move.
+        inverse = ContactManager._inverse_mass(collidable)
+        inverse2 = ContactManager._inverse_mass(collidable2)
+        total = inverse + inverse2
+        if not total or not response.overlap:
+            return
+        overlap_v = response.overlap_v
+        if inverse:
+            share = inverse / total
+            offset = self._offsets.setdefault(collidable, [0.0, 0.0])
+            offset[0] -= overlap_v.x * share
+            offset[1] -= overlap_v.y * share
+        if inverse2:
+            share = inverse2 / total
+            offset = self._offsets.setdefault(collidable2, [0.0, 0.0])
+            offset[0] += overlap_v.x * share
+            offset[1] += overlap_v.y * share
+
+    @staticmethod
+    def _inverse_mass(collidable: Collidable) -> float:
+        if isinstance(collidable, PhysicsBody) and collidable.world and collidable.mass > 0:
+            return 1 / collidable.mass
+        return 0.0
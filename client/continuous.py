@@ -0,0 +1,87 @@
+"""
+Continuous collision for fast PhysicsBodies: instead of only testing where a body ends up after a tick, its bounding box
+is swept along the tick's move against static geometry, and the move is cut short where it first touches something.
+
+Discrete tests catch everything that moves less than half its own size per tick, so only longer moves are swept.
+Boxes are swept against bounding boxes, which is exact for tiles and walls and conservative for other shapes, the
+narrowphase resolves what is actually touching on the next tick.
+"""
+from math import inf
+
+from client.broadphase import StaticIndex
+from client.logic import Collidable
+
+Box = ((float, float), (float, float))
+
+
+def time_of_impact(box: Box, move_x: float, move_y: float, other: Box) -> (float, float, float):
+    """
+    Sweeps a box along a move against a still box.
+    :return: (fraction of the move at which they first touch, normal_x, normal_y) with the axis-aligned normal pointing
+    back against the move, or None if they don't touch during the move or already overlap at its start.
+    """
+    (min_x, min_y), (max_x, max_y) = box
+    (other_min_x, other_min_y), (other_max_x, other_max_y) = other
+    if move_x > 0:
+        entry_x, exit_x = (other_min_x - max_x) / move_x, (other_max_x - min_x) / move_x
+    elif move_x < 0:
+        entry_x, exit_x = (other_max_x - min_x) / move_x, (other_min_x - max_x) / move_x
+    elif max_x > other_min_x and min_x < other_max_x:
+        entry_x, exit_x = -inf, inf
+    else:
+        return None
+    if move_y > 0:
+        entry_y, exit_y = (other_min_y - max_y) / move_y, (other_max_y - min_y) / move_y
+    elif move_y < 0:
+        entry_y, exit_y = (other_max_y - min_y) / move_y, (other_min_y - max_y) / move_y
+    elif max_y > other_min_y and min_y < other_max_y:
+        entry_y, exit_y = -inf, inf
+    else:
+        return None
+    entry = max(entry_x, entry_y)
+    if entry < 0 or entry >= 1 or entry > min(exit_x, exit_y):
+        return None
+    if entry_x > entry_y:
+        return entry, -1.0 if move_x > 0 else 1.0, 0.0
+    return entry, 0.0, -1.0 if move_y > 0 else 1.0
+
+
+def sweep(box: Box, move_x: float, move_y: float, statics: StaticIndex,
+          iterations: int = 3) -> (float, float, bool, bool):
+    """
+    Moves a box along a move, stopping at the first static Collidable it would touch and sliding along it for the rest
+    of the move, up to iterations times.
+    :param box: the box where the move starts.
+    :return: (x, y) of the move that is actually made, and whether it was blocked along x and along y.
+    """
+    (min_x, min_y), (max_x, max_y) = box
+    moved_x = moved_y = 0.0
+    blocked_x = blocked_y = False
+    for _ in range(iterations):
+        if not move_x and not move_y:
+            break
+        cells = Collidable.cells_of((min(min_x, min_x + move_x), min(min_y, min_y + move_y)),
+                                    (max(max_x, max_x + move_x), max(max_y, max_y + move_y)))
+        first = 1.0
+        normal = None
+        current = ((min_x, min_y), (max_x, max_y))
+        for static in statics.candidates(cells):
+            hit = time_of_impact(current, move_x, move_y, static.aabb)
+            if hit and hit[0] < first:
+                first, normal = hit[0], hit[1:]
+        step_x, step_y = move_x * first, move_y * first
+        min_x += step_x
+        max_x += step_x
+        min_y += step_y
+        max_y += step_y
+        moved_x += step_x
+        moved_y += step_y
+        if normal is None:
+            break
+        if normal[0]:
+            blocked_x = True
+            move_x, move_y = 0.0, move_y * (1 - first)
+        else:
+            blocked_y = True
+            move_x, move_y = move_x * (1 - first), 0.0
+    return moved_x, moved_y, blocked_x, blocked_y
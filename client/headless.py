@@ -0,0 +1,150 @@
+"""
+Stand-ins for the parts of pyglet that client.logic needs, so the collision and physics core can run without a window
+or GL context (benchmarks, replays, CI boxes).
+
+Headless mode is picked when client.logic is first imported, either by setting the INVICTUS_HEADLESS environment
+variable or by calling enable() beforehand.
+"""
+import os
+import struct
+from pathlib import Path
+
+ENABLED = os.environ.get('INVICTUS_HEADLESS', '').lower() not in ('', '0', 'false')
+
+path = ['resources/', 'resources/images/']  # searched in order by load_image, mirrors pyglet.resource.path
+
+
+def enable():
+    """
+    Switches on headless mode. Has no effect on a client.logic that has already been imported.
+    """
+    global ENABLED
+    ENABLED = True
+
+
+class key:
+    """
+    The pyglet.window.key symbols used by the client.
+    """
+    A, D, S, W = ord('a'), ord('d'), ord('s'), ord('w')
+    SPACE = 32
+    ESCAPE = 65307
+    LEFT, UP, RIGHT, DOWN = 65361, 65362, 65363, 65364
+
+
+class KeyStateHandler(dict):
+    """
+    Same behaviour as pyglet.window.key.KeyStateHandler: maps key symbols to whether they are held down.
+    """
+
+    def on_key_press(self, symbol, modifiers):
+        self[symbol] = True
+
+    def on_key_release(self, symbol, modifiers):
+        self[symbol] = False
+
+    def __getitem__(self, symbol):
+        return self.get(symbol, False)
+
+
+class Image:
+    """
+    An image with a size and anchor but no texture.
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.anchor_x = 0
+        self.anchor_y = 0
+
+
+def load_image(name: str) -> Image:
+    """
+    Headless pyglet.resource.image: finds the file on path and reads its size from the PNG header.
+    Nothing is cached here, images are kept by the shared cache in client.preload.
+    """
+    for directory in path:
+        file = Path(directory).joinpath(name)
+        if file.is_file():
+            with open(file, 'rb') as f:
+                return decode_png(f.read(24))
+    raise FileNotFoundError(f'Resource "{name}" was not found on the path.')
+
+
+def decode_png(data: bytes) -> Image:
+    """
+    Headless pyglet.image.load for PNG data, only the header is read for the image's size.
+    """
+    if data[:8] != b'\x89PNG\r\n\x1a\n':
+        raise ValueError('Not a PNG image.')
+    width, height = struct.unpack('>II', data[16:24])
+    return Image(width, height)
+
+
+class Sprite:
+    """
+    Keeps the state of a pyglet.sprite.Sprite (position, scale, image) without drawing anything.
+    """
+
+    def __init__(self, img, x=0, y=0, blend_src=None, blend_dest=None, batch=None, group=None, usage=None,
+                 subpixel=False):
+        self._image = img
+        self._x = x
+        self._y = y
+        self._batch = batch
+        self._group = group
+        self._rotation = 0
+        self._scale = 1.0
+        self._scale_x = 1.0
+        self._scale_y = 1.0
+        self._visible = True
+        self._opacity = 255
+
+    image = property(lambda self: self._image, lambda self, img: setattr(self, '_image', img))
+    batch = property(lambda self: self._batch, lambda self, batch: setattr(self, '_batch', batch))
+    group = property(lambda self: self._group, lambda self, group: setattr(self, '_group', group))
+    x = property(lambda self: self._x, lambda self, x: setattr(self, '_x', x))
+    y = property(lambda self: self._y, lambda self, y: setattr(self, '_y', y))
+    rotation = property(lambda self: self._rotation, lambda self, rotation: setattr(self, '_rotation', rotation))
+    scale = property(lambda self: self._scale, lambda self, scale: setattr(self, '_scale', scale))
+    scale_x = property(lambda self: self._scale_x, lambda self, scale_x: setattr(self, '_scale_x', scale_x))
+    scale_y = property(lambda self: self._scale_y, lambda self, scale_y: setattr(self, '_scale_y', scale_y))
+    visible = property(lambda self: self._visible, lambda self, visible: setattr(self, '_visible', visible))
+    opacity = property(lambda self: self._opacity, lambda self, opacity: setattr(self, '_opacity', opacity))
+
+    @property
+    def position(self):
+        return self._x, self._y
+
+    @position.setter
+    def position(self, position):
+        self._x, self._y = position
+
+    @property
+    def width(self):
+        return self._image.width * abs(self._scale_x * self._scale)
+
+    @property
+    def height(self):
+        return self._image.height * abs(self._scale_y * self._scale)
+
+    def update(self, x=None, y=None, rotation=None, scale=None, scale_x=None, scale_y=None):
+        if x is not None:
+            self._x = x
+        if y is not None:
+            self._y = y
+        if rotation is not None:
+            self._rotation = rotation
+        if scale is not None:
+            self._scale = scale
+        if scale_x is not None:
+            self._scale_x = scale_x
+        if scale_y is not None:
+            self._scale_y = scale_y
+
+    def draw(self):
+        pass
+
+    def delete(self):
+        self._batch = None
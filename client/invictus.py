@@ -5,7 +5,16 @@ from pathlib import Path
 import pyglet
 from collision import Vector
 
-from client.logic import Asset, Collidable, PhysicsBody, Player
+from client.camera import Camera
+from client.level import Level, LevelStreamer
+from client.logic import Asset, Collidable, Player
+from client.network import RemoteState
+from client.overlay import ProfilerOverlay
+from client.profiler import FrameProfiler
+from client.recording import Recorder
+from client.preload import Manifest, Preloader
+from client.simulation import Simulation
+from client.timestep import FixedTimestep
 
 
 def start():
@@ -17,17 +26,24 @@ def start():
     overlay_batch = pyglet.graphics.Batch()
 
     objects: [Asset] = []
-    collidables: [Collidable] = []
-    physics_objects: [PhysicsBody] = []
-    players: [Player] = []
 
     resource_path = Path('resources/')
     audio_path = resource_path.joinpath('audio/')
     image_path = resource_path.joinpath('images/')
     level_path = resource_path.joinpath('levels/')
     config_file = resource_path.joinpath('config.ini')
-
-    if not os.path.exists(resource_path) or not os.path.exists(audio_path) or not os.path.exists(image_path):
+    manifest_file = resource_path.joinpath('manifest.json')
+
+    missing = not os.path.exists(resource_path) or not os.path.exists(audio_path) or not os.path.exists(image_path)
+    manifest = None
+    if not missing:
+        if os.path.exists(manifest_file):
+            manifest = Manifest.read(manifest_file)
+        else:
+            manifest = Manifest.scan(resource_path)
+            manifest.write(manifest_file)
+        missing = bool(manifest.missing(resource_path))
+    if missing:
         txt = pyglet.text.Label('Missing resource files, please reinstall.', font_name='Times New Roman',
                                 font_size=20, x=temp_window.width // 2, y=temp_window.height // 2,
                                 anchor_x='center', anchor_y='center', batch=overlay_batch)
@@ -48,7 +64,12 @@ def start():
             'fullscreen': 'False',
             'windowstyle': 'Borderless',
             'monitor': '0',
-            'vsync': 'False'
+            'vsync': 'False',
+            'profiletrace': '',
+            'level': '',
+            'server': '',
+            'record': '',
+            'tickrate': '120'
         }
         with open(config_file, 'w') as f:
             config.write(f)
@@ -65,40 +86,131 @@ def start():
     del style, resolution
 
     pyglet.resource.path = [str(resource_path), str(image_path), str(audio_path), str(level_path)]
+    preloader = Preloader(resource_path, manifest)
+    preloader.start()
+    if not show_loading_screen(window, overlay_batch, preloader):
+        return
+    if preloader.changed:
+        print(f'Resource files differ from the manifest: {", ".join(preloader.changed)}')
+    simulation = Simulation(window.width, window.height)
+    trace_path = config['Client'].get('profiletrace', fallback='') or None
+    profiler = FrameProfiler(trace_path=trace_path)
+    # Only attached while the overlay is up or a trace is written, timing each phase has a cost of its own.
+    simulation.profiler = profiler if trace_path else None
+    camera = Camera(window.width, window.height, asset_batch)
+    profiler_overlay = ProfilerOverlay(profiler, window.height, overlay_batch)
     test_obj = Collidable(rel_pos_vector=Vector(0, 0), window_width=window.width, window_height=window.height,
                           image_path='green.png', batch=asset_batch)
-    collidables.append(test_obj)
+    simulation.add(test_obj)
+    camera.track(test_obj)
     test_plyr = Player(rel_pos_vector=Vector(16, 9), window_width=window.width, window_height=window.height,
-                       image_path='blue.png', batch=asset_batch)
+                       image_path='blue.png', batch=asset_batch, continuous=True)
     window.push_handlers(test_plyr.key_handler)
-    collidables.append(test_obj)
-    collidables.append(test_plyr)
-    physics_objects.append(test_plyr)
-    players.append(test_plyr)
+    simulation.add(test_plyr)
+    camera.track(test_plyr)
+
+    level_name = config['Client'].get('level', fallback='')
+    streamer = None
+    if level_name and level_path.joinpath(level_name, 'level.json').exists():
+        level = Level(level_path.joinpath(level_name))
+        streamer = LevelStreamer(level, window.width, window.height, batch=asset_batch, simulation=simulation,
+                                 camera=camera)
+        test_plyr.set_rel_vector(level.spawn, window.width, window.height)
+
+        def stream_level(dt):
+            streamer.update(test_plyr.rel_x, test_plyr.rel_y)
+
+        stream_level(0)
+        pyglet.clock.schedule_interval(stream_level, 1 / 10)
+
+    server_address = config['Client'].get('server', fallback='')
+    remote = None
+    remote_assets: {int: Asset} = {}
+    if server_address:
+        host, _, port = server_address.rpartition(':')
+        remote = RemoteState(host, int(port))
+        remote.start()
+
+    def draw_remote():
+        states = remote.sample()
+        for eid in remote_assets.keys() - states.keys():
+            remote_assets.pop(eid).delete()
+        for eid, (rel_x, rel_y, health) in states.items():
+            asset = remote_assets.get(eid)
+            if asset is None:
+                remote_assets[eid] = Asset(rel_pos_vector=Vector(rel_x, rel_y), window_width=window.width,
+                                           window_height=window.height, image_path='blue.png', batch=asset_batch)
+            else:
+                asset.set_rel_vector(Vector(rel_x, rel_y), window.width, window.height)
 
     @window.event
     def on_draw():
+        profiling = simulation.profiler is not None
+        start = profiler.now() if profiling else 0.0
         window.clear()
+        alpha = timestep.alpha
+        simulation.physics_world.interpolate(alpha)
+        if remote:
+            draw_remote()
+        # The interpolated position the player is drawn at, following the simulated one would scroll in tick steps.
+        camera.follow(*simulation.physics_world.interpolated_position(test_plyr, alpha))
+        camera.cull(simulation)
+        camera.apply()
         asset_batch.draw()
+        camera.restore()
         overlay_batch.draw()
+        if profiling:
+            profiler.record('draw', profiler.now() - start)
+            profiler.end_frame()
 
-    def update(dt, window_width, window_height):
-        cells: {Collidable} = {}
-        for collidable in collidables:
-            for cell in collidable.cells:
-                if (cell[0] * cell[1]) not in cells:
-                    cells[cell[0] * cell[1]] = []
-                cells[cell[0] * cell[1]].append(collidable)
-        for cell in cells:
-            for collidable in cells[cell]:
-                for collidable2 in cells[cell]:
-                    if collidable.is_colliding(collidable2):
-                        print("Colliding")
-        for player in players:
-            player.on_update(dt, window_width, window_height)
-
-    pyglet.clock.schedule_interval(update, 1 / 120, window_width=window.width, window_height=window.height)
+    @window.event
+    def on_key_press(symbol, modifiers):
+        if symbol == pyglet.window.key.F3:
+            profiler_overlay.toggle()
+            simulation.profiler = profiler if profiler_overlay.visible or trace_path else None
+
+    tick_rate = float(config['Client'].get('tickrate', fallback='120'))
+    timestep = FixedTimestep(simulation.step, step=1 / tick_rate)
+    record_path = config['Client'].get('record', fallback='')
+    recorder = Recorder(record_path, simulation, timestep) if record_path else None
+
+    def tick(dt):
+        if recorder:
+            recorder.frame(dt)
+        timestep.tick(dt)
+
+    # Ticked once per frame; drawing runs as fast as vsync allows while the simulation always steps 1/tickrate s.
+    pyglet.clock.schedule(tick)
     pyglet.app.run()
+    profiler.close()
+    if recorder:
+        recorder.close()
+    if remote:
+        remote.close()
+    if streamer:
+        streamer.close()
+
+
+def show_loading_screen(window: pyglet.window.Window, batch: pyglet.graphics.Batch, preloader: Preloader) -> bool:
+    """
+    Draws the loading progress until the preloader has loaded everything.
+    :return: False if the window was closed first.
+    """
+    label = pyglet.text.Label('Loading', font_name='Times New Roman', font_size=20, x=window.width // 2,
+                              y=window.height // 2, anchor_x='center', anchor_y='center', batch=batch)
+    while not preloader.pump():
+        pyglet.clock.tick()
+        window.dispatch_events()
+        if window.has_exit:
+            preloader.close()
+            label.delete()
+            return False
+        label.text = f'Loading {preloader.progress:.0%}'
+        window.clear()
+        batch.draw()
+        window.flip()
+    label.delete()
+    return True
 
 
 if __name__ == '__main__':
@@ -0,0 +1,201 @@
+"""
+Chunked levels, streamed in around the player.
+
+A level is a directory in resources/levels/:
+
+    <name>/level.json           {"chunk_size": 8, "tile_size": 1.0, "spawn": [8, 4.5],
+                                 "tiles": {"0": {"image": "green.png", "solid": true}, ...}}
+    <name>/chunks/<cx>_<cy>.json {"tiles": [[column, row, tile_id], ...]}
+
+chunk_size is the number of tiles along each side of a chunk, tile_size the width of a tile in relative coordinates
+and column/row are tile positions inside the chunk. Chunks with no file are empty.
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor, Future
+from math import floor
+from pathlib import Path
+
+from collision import Vector
+
+from client import headless
+from client.logic import Asset, Collidable
+from client.preload import images
+
+if not headless.ENABLED:
+    from pyglet.image.atlas import TextureBin
+
+ChunkCoords = (int, int)
+
+
+class Level:
+    """
+    The metadata of a level on disk. Chunk contents are read on demand.
+    """
+
+    def __init__(self, directory: Path):
+        """
+        :param directory: the level's directory, holding level.json and a chunks directory.
+        """
+        self.directory = Path(directory)
+        with open(self.directory.joinpath('level.json'), 'r') as f:
+            data: {} = json.load(f)
+        self.name = self.directory.name
+        self.chunk_size: int = data.get('chunk_size', 8)
+        self.tile_size: float = data.get('tile_size', 1.0)
+        self.spawn = Vector(*data.get('spawn', (0, 0)))
+        self.tiles: {int: {}} = {int(k): v for k, v in data['tiles'].items()}
+
+    @property
+    def chunk_width(self) -> float:
+        """
+        Width of a chunk in relative coordinates.
+        """
+        return self.chunk_size * self.tile_size
+
+    def chunk_of(self, rel_x: float, rel_y: float) -> ChunkCoords:
+        return floor(rel_x / self.chunk_width), floor(rel_y / self.chunk_width)
+
+    def read_chunk(self, coords: ChunkCoords) -> [(int, int, int)]:
+        """
+        Reads the tiles of one chunk as (column, row, tile_id). Safe to call off the main thread.
+        """
+        file = self.directory.joinpath('chunks', f'{coords[0]}_{coords[1]}.json')
+        if not file.is_file():
+            return []
+        with open(file, 'r') as f:
+            return [tuple(tile) for tile in json.load(f)['tiles']]
+
+
+class TileAtlas:
+    """
+    Packs tile images into shared textures so that every tile of a kind reuses one texture region.
+    """
+
+    def __init__(self, texture_size: int = 1024):
+        self._bin = None if headless.ENABLED else TextureBin(texture_size, texture_size)
+        self._images = {}
+
+    def get(self, image_name: str):
+        """
+        Gives the atlas region for an image on the pyglet resource path, packing it the first time it is asked for.
+        The image is taken from the shared image cache, where the Preloader has already decoded it.
+        """
+        image = self._images.get(image_name)
+        if image is None:
+            image = images.get(image_name)
+            if self._bin is not None:
+                # Copied out of the cached texture, which is much cheaper than decoding the file again.
+                image = self._bin.add(image.get_image_data())
+            image.anchor_x = image.width // 2
+            image.anchor_y = image.height // 2
+            self._images[image_name] = image
+        return image
+
+
+class Chunk:
+    """
+    The sprites of one chunk that is in view.
+    """
+
+    def __init__(self, coords: ChunkCoords, assets: [Asset]):
+        self.coords = coords
+        self.assets = assets
+
+
+class LevelStreamer:
+    """
+    Keeps the chunks around a point of focus (normally the player) loaded and everything else released.
+    Chunk files are read on a worker thread, sprites are made on the main thread the next time update is called.
+    """
+
+    def __init__(self, level: Level, window_width: int, window_height: int, batch=None, simulation=None,
+                 radius: int = 1, atlas: TileAtlas = None, camera=None):
+        """
+        :param level: the level to stream.
+        :param window_width: width of the window the level is drawn in.
+        :param window_height: height of the window the level is drawn in.
+        :param batch: batch that tile sprites are added to.
+        :param simulation: if given, solid tiles are added to and removed from this Simulation with their chunk.
+        :param radius: chunks within this many chunks of the focus are kept loaded.
+        :param atlas: atlas to pack tile images into, a new one is made if not given.
+        :param camera: if given, tiles are culled by this Camera while their chunk is loaded.
+        """
+        self.level = level
+        self.window_width = window_width
+        self.window_height = window_height
+        self.batch = batch
+        self.simulation = simulation
+        self.radius = radius
+        self.atlas = atlas or TileAtlas()
+        self.camera = camera
+        self.chunks: {ChunkCoords: Chunk} = {}
+        self._pending: {ChunkCoords: Future} = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='LevelStreamer')
+
+    def update(self, rel_x: float, rel_y: float):
+        """
+        Streams chunks in and out around a point in relative coordinates.
+        """
+        center_x, center_y = self.level.chunk_of(rel_x, rel_y)
+        radius = self.radius
+        wanted = {(x, y) for x in range(center_x - radius, center_x + radius + 1)
+                  for y in range(center_y - radius, center_y + radius + 1)}
+
+        # Chunks are released one chunk further out than they are loaded, so walking along a border doesn't thrash.
+        for coords in list(self.chunks):
+            if max(abs(coords[0] - center_x), abs(coords[1] - center_y)) > radius + 1:
+                self._unload(coords)
+        for coords in list(self._pending):
+            if coords not in wanted and self._pending[coords].cancel():
+                del self._pending[coords]
+
+        for coords in wanted:
+            if coords not in self.chunks and coords not in self._pending:
+                self._pending[coords] = self._executor.submit(self.level.read_chunk, coords)
+        for coords, future in list(self._pending.items()):
+            if future.done():
+                del self._pending[coords]
+                self._build(coords, future.result())
+
+    def close(self):
+        """
+        Stops streaming and releases every loaded chunk.
+        """
+        self._executor.shutdown(wait=False)
+        for coords in list(self.chunks):
+            self._unload(coords)
+        self._pending.clear()
+
+    def _build(self, coords: ChunkCoords, tiles: [(int, int, int)]):
+        level = self.level
+        tile_size = level.tile_size
+        half = tile_size / 2
+        origin_x = coords[0] * level.chunk_width
+        origin_y = coords[1] * level.chunk_width
+        box = (Vector(-half, half), Vector(half, half), Vector(half, -half), Vector(-half, -half))
+        assets = []
+        for column, row, tile_id in tiles:
+            tile = level.tiles[tile_id]
+            position = Vector(origin_x + (column + 0.5) * tile_size, origin_y + (row + 0.5) * tile_size)
+            kwargs = {'rel_pos_vector': position, 'window_width': self.window_width,
+                      'window_height': self.window_height, 'img': self.atlas.get(tile['image']),
+                      'desired_width': tile_size, 'desired_height': tile_size, 'batch': self.batch}
+            if tile.get('solid'):
+                asset = Collidable(points=box, **kwargs)
+                if self.simulation:
+                    self.simulation.add(asset)
+            else:
+                asset = Asset(**kwargs)
+            if self.camera:
+                self.camera.track(asset)
+            assets.append(asset)
+        self.chunks[coords] = Chunk(coords, assets)
+
+    def _unload(self, coords: ChunkCoords):
+        chunk = self.chunks.pop(coords)
+        for asset in chunk.assets:
+            if self.camera:
+                self.camera.forget(asset)
+            if self.simulation and isinstance(asset, Collidable):
+                self.simulation.remove(asset)
+            asset.delete()
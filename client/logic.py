@@ -1,10 +1,20 @@
 from math import floor
 from typing import Tuple
 
-import pyglet
-from collision import collide, Response, Vector, Circle, Poly
-from pyglet.window import key
-from pyglet.window.key import KeyStateHandler
+from collision import Vector
+
+from client import headless
+from client.colliders import Shape, collide, shapes
+from client.preload import images
+
+if headless.ENABLED:
+    from client.headless import Sprite, KeyStateHandler, key
+else:
+    from pyglet.sprite import Sprite
+    from pyglet.window import key
+    from pyglet.window.key import KeyStateHandler
+
+load_image = images.get
 
 Cell = [int, int]
 
@@ -24,7 +34,7 @@ class KeyMap:
         self.right = right
 
 
-class Asset(pyglet.sprite.Sprite):
+class Asset(Sprite):
     """
     Anything that is drawn onto the screen that isn't an overlay.
     """
@@ -39,14 +49,16 @@ class Asset(pyglet.sprite.Sprite):
         :param image_path: path to the image file from the pyglet search directory nearest it.
         """
         if image_path:
-            img = pyglet.resource.image(image_path)
-            img.anchor_x = img.width // 2
-            img.anchor_y = img.height // 2
+            img = load_centered_image(image_path)
         elif (len(args) > 0 and args[0]) or 'img' in kwargs:
-            img = args[0] if len(args) > 0 and args[0] else kwargs['img']
+            if len(args) > 0 and args[0]:
+                img, args = args[0], args[1:]
+            else:
+                img = kwargs.pop('img')
         else:
             raise InvalidArguments
-        self._rel_vector = rel_pos_vector
+        # A copy, the position is changed in place as the Asset moves and must not move the caller's Vector with it.
+        self._rel_vector = Vector(rel_pos_vector.x, rel_pos_vector.y)
         x = rel_pos_vector.x * window_width / 16
         y = rel_pos_vector.y * window_height / 9
         super(Asset, self).__init__(img=img, x=x, y=y, *args, **kwargs)
@@ -68,10 +80,26 @@ class Asset(pyglet.sprite.Sprite):
         return self._rel_vector.y
 
     def set_rel_vector(self, rel_vector: Vector, window_width: int, window_height: int):
-        self._rel_vector = rel_vector
+        self._rel_vector.x = rel_vector.x
+        self._rel_vector.y = rel_vector.y
         self.x = int(rel_vector.x * window_width / 16)
         self.y = int(rel_vector.y * window_height / 9)
 
+    def reset(self, rel_pos_vector: Vector, window_width: int, window_height: int, image_path: str = None,
+              img=None):
+        """
+        Puts a recycled Asset back into a fresh state in place, reusing its sprite and vertex list.
+        :param rel_pos_vector: new relative position.
+        :param image_path: new image to show, the current one is kept if neither this nor img is given.
+        :param img: new image object to show.
+        """
+        if image_path:
+            self.image = load_centered_image(image_path)
+        elif img:
+            self.image = img
+        self.set_rel_vector(rel_pos_vector, window_width, window_height)
+        self.visible = True
+
     def set_rel_x(self, rel_x: float, window_width: int):
         self._rel_vector.x = rel_x
         self.x = int(rel_x * window_width / 16)
@@ -91,18 +119,21 @@ class Collidable(Asset):
 
     def __init__(self, points: Tuple[Tuple[float]] = None, radius: float = None, *args, **kwargs):
         """
-        :param points: A tuple of tuples of floats (x,y) that describes the boundary using relative coordinates from the
-         top left most point going clockwise around the perimeter. Object becomes a polygon or point.
+        :param points: A tuple of tuples of floats (x,y) that describes the convex boundary using relative coordinates
+         from the center of the object, from the top left most point going clockwise around the perimeter.
+         Object becomes a polygon or point.
         :param radius: A relative coordinate describing the radius of a circular boundary from the center of the object.
         Object becomes a circle.
         """
         super(Collidable, self).__init__(*args, **kwargs)
+        self._aabb = None
+        self._cells = None
         if radius and not points:
-            self.collider = Circle(self.rel_vector, radius)
+            self.collider: Shape = shapes.circle(self.rel_vector, radius)
         elif points and len(points) != 1:
-            self.collider = Poly(self.rel_vector, points)
+            self.collider = shapes.poly(self.rel_vector, points)
         elif points:
-            self.collider = None
+            self.collider = shapes.point(self.rel_vector)
         else:
             if (len(args) > 1 and args[1]) or 'window_width' in kwargs:
                 width = args[1] if len(args) > 1 and args[1] else kwargs['window_width']
@@ -112,63 +143,74 @@ class Collidable(Asset):
                 height = args[2] if len(args) > 2 and args[2] else kwargs['window_height']
             else:
                 raise InvalidArguments
-            self.collider = Poly(self.rel_vector,
-                                 (
-                                     Vector(self.image.width / width * 16 + self.rel_x,
-                                            self.image.height / height * 9 + self.rel_y),
-                                     Vector(self.image.width / width * 16 + self.rel_x,
-                                            -self.image.height / height * 9 + self.rel_y),
-                                     Vector(-self.image.width / width * 16 + self.rel_x,
-                                            -self.image.height / height * 9 + self.rel_y),
-                                     Vector(-self.image.width / width * 16 + self.rel_x,
-                                            self.image.height / height * 9 + self.rel_y)))
+            half_width = self.width / width * 16 / 2
+            half_height = self.height / height * 9 / 2
+            self.collider = shapes.poly(self.rel_vector, ((-half_width, half_height), (half_width, half_height),
+                                                          (half_width, -half_height), (-half_width, -half_height)))
 
     @property
-    def cells(self) -> [int, int]:
-        """
-        Gives the row and column of the cell(s) that this object is in. Used for collision detection.
-        """
-        if not self.collider:
-            result = [[floor(self.rel_x / Collidable.cell_width), floor(self.rel_y / Collidable.cell_height)]]
-        elif isinstance(self.collider, Poly):
-            result = []
-            for point in self.collider.points:
-                temp = [floor(point[0] / Collidable.cell_width), floor(point[1] / Collidable.cell_height)]
-                if temp not in result:
-                    result.append(temp)
-        elif isinstance(self.collider, Circle):
-            points = [self.rel_vector + Vector(0, self.collider.radius),
-                      self.rel_vector + Vector(self.collider.radius, 0),
-                      self.rel_vector + Vector(0, -self.collider.radius),
-                      self.rel_vector + Vector(-self.collider.radius, 0)]
-            result = []
-            for point in points:
-                temp = [floor(point[0] / Collidable.cell_width), floor(point[1] / Collidable.cell_height)]
-                if temp not in result:
-                    result.append(temp)
-        else:
-            return None
-        return result
+    def aabb(self) -> ((float, float), (float, float)):
+        """
+        The axis-aligned bounding box of this object as ((min_x, min_y), (max_x, max_y)) in relative coordinates.
+        Cached until the object is moved.
+        """
+        if self._aabb is None:
+            collider = self.collider
+            pos = collider.pos
+            self._aabb = ((pos.x + collider.min_x, pos.y + collider.min_y),
+                          (pos.x + collider.max_x, pos.y + collider.max_y))
+        return self._aabb
+
+    @property
+    def cells(self) -> frozenset:
+        """
+        Gives every (column, row) cell that this object's bounding box covers. Used for collision detection.
+        Cached until the object is moved, so the same frozenset is returned while the object stays still.
+        """
+        if self._cells is None:
+            self._cells = Collidable.cells_of(*self.aabb)
+        return self._cells
+
+    @staticmethod
+    def cells_of(low: (float, float), high: (float, float)) -> frozenset:
+        """
+        Gives every (column, row) cell that a bounding box, given by its (min_x, min_y) and (max_x, max_y) corners,
+        covers.
+        """
+        columns = range(floor(low[0] / Collidable.cell_width), floor(high[0] / Collidable.cell_width) + 1)
+        rows = range(floor(low[1] / Collidable.cell_height), floor(high[1] / Collidable.cell_height) + 1)
+        return frozenset((column, row) for column in columns for row in rows)
+
+    def invalidate_bounds(self):
+        """
+        Marks the cached bounding box and cells as stale. Call after moving the object or its collider.
+        """
+        self._aabb = None
+        self._cells = None
+
+    def set_rel_vector(self, rel_vector: Vector, window_width: int, window_height: int):
+        super(Collidable, self).set_rel_vector(rel_vector, window_width, window_height)
+        self.invalidate_bounds()
+
+    def set_rel_x(self, rel_x: float, window_width: int):
+        super(Collidable, self).set_rel_x(rel_x, window_width)
+        self.invalidate_bounds()
+
+    def set_rel_y(self, rel_y: float, window_height: int):
+        super(Collidable, self).set_rel_y(rel_y, window_height)
+        self.invalidate_bounds()
 
     def is_colliding(self, other):
         """
         Returns a collision response if the two objects are colliding, else returns None.
         """
         if isinstance(other, Collidable):
-            resp = Response()
-            if self.collider:
-                if other.collider:
-                    result = collide(self.collider, other.collider, resp)
-                else:
-                    result = collide(self.collider, other.rel_vector, resp)
-            else:
-                if other.collider:
-                    result = collide(self.rel_vector, other.collider, resp)
-                else:
-                    result = collide(self.rel_vector, other.rel_vector, resp)
-        else:
-            return NotImplemented
-        return resp if result else None
+            return collide(self.collider, other.collider)
+        return NotImplemented
+
+    def delete(self):
+        shapes.release(self.collider)
+        super(Collidable, self).delete()
 
 
 class PhysicsBody(Collidable):
@@ -176,23 +218,106 @@ class PhysicsBody(Collidable):
     Any object that experiences full game physics, not just collisions.
     """
 
-    def __init__(self, dx: Vector = Vector(0, 0), d2x: Vector = Vector(0, 0), mass: float = 1, *args, **kwargs):
+    def __init__(self, dx: Vector = Vector(0, 0), d2x: Vector = Vector(0, 0), mass: float = 1,
+                 continuous: bool = False, *args, **kwargs):
         """
         :param dx: velocity of the object at state 1, given with relative coordinates.
         :param d2x: acceleration of the object at state 1, given with relative coordinates.
         :param mass: mass given in mass relative to player (player mass = 1)
+        :param continuous: whether the object's moves are swept against static geometry so it can't pass through thin
+        walls between ticks. Costs a broadphase query per tick it moves far, meant for fast movers. Set it before the
+        object is added to a Simulation.
         """
         super(PhysicsBody, self).__init__(*args, **kwargs)
+        self.world = None  # the PhysicsWorld owning this body's state, if any
+        self.continuous = continuous
         self.dx: Vector = dx
         self.d2x: Vector = d2x
         self.mass: float = mass
 
+    @property
+    def dx(self) -> Vector:
+        """
+        Velocity in relative coordinates/sec.
+        """
+        return self.world.get_velocity(self) if self.world else self._dx
+
+    @dx.setter
+    def dx(self, dx: Vector):
+        if self.world:
+            self.world.set_velocity(self, dx)
+        else:
+            self._dx = dx
+
+    @property
+    def d2x(self) -> Vector:
+        """
+        Acceleration in relative coordinates/sec^2.
+        """
+        return self.world.get_acceleration(self) if self.world else self._d2x
+
+    @d2x.setter
+    def d2x(self, d2x: Vector):
+        if self.world:
+            self.world.set_acceleration(self, d2x)
+        else:
+            self._d2x = d2x
+
+    @property
+    def mass(self) -> float:
+        return self.world.get_mass(self) if self.world else self._mass
+
+    @mass.setter
+    def mass(self, mass: float):
+        if self.world:
+            self.world.set_mass(self, mass)
+        else:
+            self._mass = mass
+
+    def set_rel_vector(self, rel_vector: Vector, window_width: int, window_height: int):
+        super(PhysicsBody, self).set_rel_vector(rel_vector, window_width, window_height)
+        if self.world:
+            self.world.set_position(self, self.rel_x, self.rel_y)
+
+    def set_rel_x(self, rel_x: float, window_width: int):
+        super(PhysicsBody, self).set_rel_x(rel_x, window_width)
+        if self.world:
+            self.world.set_position(self, self.rel_x, self.rel_y)
+
+    def set_rel_y(self, rel_y: float, window_height: int):
+        super(PhysicsBody, self).set_rel_y(rel_y, window_height)
+        if self.world:
+            self.world.set_position(self, self.rel_x, self.rel_y)
+
+    def apply_world_state(self, rel_x: float, rel_y: float, aabb: ((float, float), (float, float))):
+        """
+        Called by PhysicsWorld.step to write an integrated state back onto the body in one go.
+        The sprite is moved separately by PhysicsWorld.interpolate.
+        :param aabb: the new bounding box, or None to have it recomputed when next needed.
+        """
+        self._rel_vector.x = rel_x
+        self._rel_vector.y = rel_y
+        self._aabb = aabb
+        self._cells = None
+
     def on_update(self, dt: float, window_width: int, window_height: int):
         self.dx += self.d2x * dt
         self.set_rel_x(self.rel_x + self.dx[0] * dt, window_width)
         self.set_rel_y(self.rel_y + self.dx[1] * dt, window_height)
-        for loc in self.collider.points:
-            loc += self.dx
+        self.invalidate_bounds()
+
+    def reset(self, rel_pos_vector: Vector, window_width: int, window_height: int, image_path: str = None,
+              img=None, dx: Vector = None, d2x: Vector = None, mass: float = 1):
+        """
+        Puts a recycled PhysicsBody back into a fresh state in place.
+        :param dx: new velocity, defaults to at rest.
+        :param d2x: new acceleration, defaults to none.
+        :param mass: new mass relative to the player.
+        """
+        super(PhysicsBody, self).reset(rel_pos_vector, window_width, window_height, image_path, img)
+        self.dx = dx if dx else Vector(0, 0)
+        self.d2x = d2x if d2x else Vector(0, 0)
+        self.mass = mass
 
     def impulse(self, force: Vector, dt: float):
         self.dx += force * dt / self.mass
@@ -229,7 +354,20 @@ class Player(PhysicsBody):
             self.dead = True
         self._health = health
 
-    def on_update(self, dt: float, window_width: int, window_height: int):
+    def reset(self, rel_pos_vector: Vector, window_width: int, window_height: int, image_path: str = None,
+              img=None, dx: Vector = None, d2x: Vector = None, mass: float = 1, health: int = 100):
+        """
+        Puts a recycled Player back into a fresh state in place, alive and with no keys held.
+        """
+        super(Player, self).reset(rel_pos_vector, window_width, window_height, image_path, img, dx, d2x, mass)
+        self.key_handler.clear()
+        self._health = health
+        self.dead = False
+
+    def handle_input(self):
+        """
+        Sets the velocity of the player from the keys currently held down.
+        """
         handler = self.key_handler
         binds = self.key_binds
         vec = Vector(0, 0)
@@ -242,8 +380,21 @@ class Player(PhysicsBody):
         if handler[binds.left]:
             vec += Vector(-1, 0)
         self.dx = vec * self.speed
+
+    def on_update(self, dt: float, window_width: int, window_height: int):
+        self.handle_input()
         super(Player, self).on_update(dt, window_width, window_height)
 
 
+def load_centered_image(image_path: str):
+    """
+    Loads an image through the shared image cache, anchored at its center.
+    """
+    img = load_image(image_path)
+    img.anchor_x = img.width // 2
+    img.anchor_y = img.height // 2
+    return img
+
+
 class InvalidArguments(Exception):
     pass
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+
+from common.protocol import LENGTH, StateDecoder
+
+
+class InterpolationBuffer:
+    """
+    Recent entity states by arrival time, sampled a little in the past so there are always two states to blend between
+    and movement stays smooth whatever the server's update rate and network jitter.
+    """
+
+    def __init__(self, size: int = 32):
+        """
+        :param size: most states kept.
+        """
+        self._times: deque = deque(maxlen=size)
+        self._states: deque = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self._states)
+
+    def push(self, t: float, states: {int: (float, float, int)}):
+        """
+        Adds the full entity state received at time t. Times must not go backwards.
+        """
+        self._times.append(t)
+        self._states.append(states)
+
+    def sample(self, t: float) -> {int: (float, float, int)}:
+        """
+        Gives every entity's (x, y, health) at time t. Positions are blended linearly between the states either side of
+        t, entities that appear or disappear between them snap. Past the newest state it is held, not extrapolated.
+        """
+        if not self._states:
+            return {}
+        i = bisect_right(self._times, t)
+        if i == 0:
+            return self._states[0]
+        if i == len(self._states):
+            return self._states[-1]
+        t0, t1 = self._times[i - 1], self._times[i]
+        before, after = self._states[i - 1], self._states[i]
+        alpha = (t - t0) / (t1 - t0) if t1 > t0 else 1.0
+        result = {}
+        for eid, state in after.items():
+            old = before.get(eid)
+            if old is None:
+                result[eid] = state
+            else:
+                result[eid] = (old[0] + (state[0] - old[0]) * alpha, old[1] + (state[1] - old[1]) * alpha, state[2])
+        return result
+
+
+class RemoteState:
+    """
+    Keeps a connection to the game server on a background thread with its own asyncio loop, since pyglet's loop is not
+    asyncio, and buffers what it receives for interpolation on the main thread.
+    """
+
+    def __init__(self, host: str, port: int, delay: float = 0.1):
+        """
+        :param delay: seconds in the past states are sampled at. Should cover two or three server updates.
+        """
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.buffer = InterpolationBuffer()
+        self.bytes_received = 0
+        self.connected = False
+        self.error: Exception = None  # what ended the connection, if it failed
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop = None
+        self._writer: asyncio.StreamWriter = None
+        self._thread = threading.Thread(target=self._run, name='RemoteState', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def sample(self, now: float = None) -> {int: (float, float, int)}:
+        """
+        Gives every remote entity's interpolated (x, y, health) in relative units.
+        """
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            return self.buffer.sample(now - self.delay)
+
+    def close(self):
+        if self._loop and self._writer:
+            self._loop.call_soon_threadsafe(self._writer.close)
+        self._thread.join(timeout=1)
+
+    def _run(self):
+        try:
+            asyncio.run(self._receive())
+        except Exception as e:
+            self.error = e
+        self.connected = False
+
+    async def _receive(self):
+        self._loop = asyncio.get_running_loop()
+        reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self.connected = True
+        decoder = StateDecoder()
+        try:
+            while True:
+                header = await reader.readexactly(LENGTH.size)
+                payload = await reader.readexactly(LENGTH.unpack(header)[0])
+                states = decoder.decode(payload)
+                with self._lock:
+                    self.buffer.push(time.perf_counter(), states)
+                self.bytes_received += len(header) + len(payload)
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            self._writer.close()
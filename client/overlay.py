@@ -0,0 +1,38 @@
+import pyglet
+
+from client.profiler import FrameProfiler
+
+
+class ProfilerOverlay:
+    """
+    Shows a FrameProfiler's rolling percentiles in the corner of the window.
+    """
+
+    def __init__(self, profiler: FrameProfiler, window_height: int, batch: pyglet.graphics.Batch,
+                 refresh: float = 0.5):
+        """
+        :param profiler: the profiler to show.
+        :param window_height: height of the window the overlay is drawn in.
+        :param batch: overlay batch the text is drawn in.
+        :param refresh: seconds between text updates, laying out text every frame would skew the draw timings.
+        """
+        self.profiler = profiler
+        self.refresh = refresh
+        self.visible = False
+        self.label = pyglet.text.Label('', font_name='Courier New', font_size=10, x=8, y=window_height - 8,
+                                       anchor_x='left', anchor_y='top', multiline=True, width=480, batch=batch)
+
+    def toggle(self):
+        self.visible = not self.visible
+        if self.visible:
+            self.update()
+            pyglet.clock.schedule_interval(self.update, self.refresh)
+        else:
+            pyglet.clock.unschedule(self.update)
+            self.label.text = ''
+
+    def update(self, dt: float = None):
+        lines = ['phase         p50 ms   p95 ms   p99 ms']
+        for phase, (p50, p95, p99) in sorted(self.profiler.report().items()):
+            lines.append(f'{phase:<12}{p50:>8.3f}{p95:>9.3f}{p99:>9.3f}')
+        self.label.text = '\n'.join(lines)
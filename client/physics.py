@@ -0,0 +1,175 @@
+import numpy as np
+from collision import Vector
+
+
+class PhysicsWorld:
+    """
+    Batched physics state for a population of PhysicsBodies.
+    Positions, velocities, accelerations, masses and collider bounds are kept in contiguous NumPy arrays so that a
+    whole room is integrated in one vectorized step per tick instead of one Python call per body.
+    """
+
+    def __init__(self, window_width: int, window_height: int, capacity: int = 64):
+        """
+        :param window_width: width of the window the bodies are drawn in.
+        :param window_height: height of the window the bodies are drawn in.
+        :param capacity: number of bodies to allocate room for up front, grows as needed.
+        """
+        self.window_width = window_width
+        self.window_height = window_height
+        self.bodies = []
+        self._index: {object: int} = {}
+        self.pos = np.zeros((capacity, 2))
+        self.prev_pos = np.zeros((capacity, 2))  # positions before the last step, for interpolated drawing
+        self.vel = np.zeros((capacity, 2))
+        self.acc = np.zeros((capacity, 2))
+        self.mass = np.ones(capacity)
+        # Collider bounds as (min_x, min_y, max_x, max_y) offsets from the body's position, taken from its Shape.
+        self.bounds = np.zeros((capacity, 4))
+
+    def __len__(self):
+        return len(self.bodies)
+
+    def __contains__(self, body):
+        return body in self._index
+
+    def add(self, body):
+        """
+        Moves a PhysicsBody's state into the world. The body's dx, d2x and mass read from and write to the world
+        until it is removed.
+        """
+        if body in self._index:
+            return
+        i = len(self.bodies)
+        if i == len(self.pos):
+            self._grow()
+        dx, d2x, mass = body.dx, body.d2x, body.mass
+        self.pos[i] = self.prev_pos[i] = body.rel_x, body.rel_y
+        self.vel[i] = dx.x, dx.y
+        self.acc[i] = d2x.x, d2x.y
+        self.mass[i] = mass
+        collider = body.collider
+        self.bounds[i] = collider.min_x, collider.min_y, collider.max_x, collider.max_y
+        self.bodies.append(body)
+        self._index[body] = i
+        body.world = self
+
+    def remove(self, body):
+        """
+        Hands a body's state back to it and drops it from the world.
+        """
+        i = self._index.pop(body, None)
+        if i is None:
+            return
+        body.world = None
+        body.dx = Vector(*self.vel[i].tolist())
+        body.d2x = Vector(*self.acc[i].tolist())
+        body.mass = float(self.mass[i])
+        last = len(self.bodies) - 1
+        if i != last:
+            moved = self.bodies[last]
+            self.bodies[i] = moved
+            self._index[moved] = i
+            for array in (self.pos, self.prev_pos, self.vel, self.acc, self.mass, self.bounds):
+                array[i] = array[last]
+        self.bodies.pop()
+
+    def get_velocity(self, body) -> Vector:
+        return Vector(*self.vel[self._index[body]].tolist())
+
+    def set_velocity(self, body, dx: Vector):
+        self.vel[self._index[body]] = dx.x, dx.y
+
+    def get_acceleration(self, body) -> Vector:
+        return Vector(*self.acc[self._index[body]].tolist())
+
+    def set_acceleration(self, body, d2x: Vector):
+        self.acc[self._index[body]] = d2x.x, d2x.y
+
+    def get_mass(self, body) -> float:
+        return float(self.mass[self._index[body]])
+
+    def set_mass(self, body, mass: float):
+        self.mass[self._index[body]] = mass
+
+    def set_position(self, body, rel_x: float, rel_y: float):
+        """
+        Teleports a body. The body is not interpolated across the jump.
+        """
+        i = self._index[body]
+        self.pos[i] = self.prev_pos[i] = rel_x, rel_y
+
+    def displacement(self, body) -> (float, float):
+        """
+        How far a body moved in the last step, nudges since included.
+        """
+        i = self._index[body]
+        return self.pos[i, 0] - self.prev_pos[i, 0], self.pos[i, 1] - self.prev_pos[i, 1]
+
+    def nudge(self, offsets: {object: [float, float]}):
+        """
+        Moves bodies by small offsets in one go, such as pushing them out of contacts. Unlike set_position the moves
+        are still interpolated when drawn.
+        :param offsets: [dx, dy] in relative coordinates, by body.
+        """
+        if not offsets:
+            return
+        bodies = list(offsets)
+        indices = np.fromiter((self._index[body] for body in bodies), dtype=np.intp, count=len(bodies))
+        self.pos[indices] += np.array(list(offsets.values()))
+        for body, (rel_x, rel_y) in zip(bodies, self.pos[indices].tolist()):
+            body.apply_world_state(rel_x, rel_y, None)
+
+    def step(self, dt: float):
+        """
+        Integrates every body by dt and writes the results back to the bodies.
+        Sprites are only moved by interpolate, so drawing can run at its own rate.
+        """
+        n = len(self.bodies)
+        if not n:
+            return
+        vel = self.vel[:n]
+        vel += self.acc[:n] * dt
+        delta = vel * dt
+        self.prev_pos[:n] = self.pos[:n]
+        self.pos[:n] += delta
+        self._write_back(n)
+
+    def interpolate(self, alpha: float):
+        """
+        Moves every body's sprite to a blend of its last two simulated positions.
+        :param alpha: 0 draws the previous state, 1 draws the current one.
+        """
+        n = len(self.bodies)
+        if not n:
+            return
+        prev = self.prev_pos[:n]
+        pos = prev + (self.pos[:n] - prev) * alpha
+        pixels = (pos * (self.window_width / 16, self.window_height / 9)).astype(int).tolist()
+        for body, position in zip(self.bodies, pixels):
+            body.position = position
+
+    def interpolated_position(self, body, alpha: float) -> (float, float):
+        """
+        Where a body is drawn for a given alpha, in relative coordinates, the same blend interpolate uses.
+        """
+        i = self._index[body]
+        prev_x, prev_y = self.prev_pos[i].tolist()
+        x, y = self.pos[i].tolist()
+        return prev_x + (x - prev_x) * alpha, prev_y + (y - prev_y) * alpha
+
+    def _write_back(self, n: int):
+        pos = self.pos[:n]
+        boxes = np.concatenate((pos, pos), axis=1)
+        boxes += self.bounds[:n]
+        for body, (rel_x, rel_y), (min_x, min_y, max_x, max_y) in zip(self.bodies, pos.tolist(), boxes.tolist()):
+            body.apply_world_state(rel_x, rel_y, ((min_x, min_y), (max_x, max_y)))
+
+    def _grow(self):
+        capacity = len(self.pos) * 2
+        self.pos = np.resize(self.pos, (capacity, 2))
+        self.prev_pos = np.resize(self.prev_pos, (capacity, 2))
+        self.vel = np.resize(self.vel, (capacity, 2))
+        self.acc = np.resize(self.acc, (capacity, 2))
+        self.mass = np.resize(self.mass, capacity)
+        self.bounds = np.resize(self.bounds, (capacity, 4))
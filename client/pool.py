@@ -0,0 +1,76 @@
+from collision import Vector
+
+from client.logic import Asset, Collidable
+
+
+class AssetPool:
+    """
+    Recycles Assets of one kind (projectiles, particles, damage numbers, ...) instead of deleting them.
+    Released Assets are hidden but keep their sprite, vertex list and collider, so spawning one again is a reset in
+    place rather than a new allocation in the batch.
+    """
+
+    def __init__(self, factory: callable, window_width: int, window_height: int, simulation=None,
+                 size: int = 0, max_size: int = None):
+        """
+        :param factory: called with no arguments to make a new Asset when the pool is empty.
+        :param window_width: width of the window the Assets are in.
+        :param window_height: height of the window the Assets are in.
+        :param simulation: if given, Collidables are added to this Simulation while in use and removed when released.
+        :param size: number of Assets to make up front.
+        :param max_size: most released Assets kept, any beyond this are deleted. Unbounded if not given.
+        """
+        self.factory = factory
+        self.window_width = window_width
+        self.window_height = window_height
+        self.simulation = simulation
+        self.max_size = max_size
+        self.free: [Asset] = []
+        self.in_use: {Asset} = set()
+        self.prefill(size)
+
+    def __len__(self):
+        return len(self.free)
+
+    def prefill(self, count: int):
+        """
+        Makes Assets ahead of time so that a burst of spawns doesn't have to.
+        """
+        for _ in range(count):
+            asset = self.factory()
+            asset.visible = False
+            self.free.append(asset)
+
+    def acquire(self, rel_pos_vector: Vector, **state) -> Asset:
+        """
+        Gives an Asset at a position, recycled if one is free.
+        :param rel_pos_vector: relative position to place the Asset at.
+        :param state: anything else to reset, passed to the Asset's reset method (image_path, dx, mass, ...).
+        """
+        asset = self.free.pop() if self.free else self.factory()
+        asset.reset(rel_pos_vector, self.window_width, self.window_height, **state)
+        self.in_use.add(asset)
+        if self.simulation and isinstance(asset, Collidable):
+            self.simulation.add(asset)
+        return asset
+
+    def release(self, asset: Asset):
+        """
+        Hands an Asset back to the pool, hiding it until it is acquired again.
+        """
+        self.in_use.remove(asset)
+        if self.simulation and isinstance(asset, Collidable):
+            self.simulation.remove(asset)
+        if self.max_size is not None and len(self.free) >= self.max_size:
+            asset.delete()
+            return
+        asset.visible = False
+        self.free.append(asset)
+
+    def clear(self):
+        """
+        Deletes every free Asset. Assets still in use are left alone.
+        """
+        for asset in self.free:
+            asset.delete()
+        self.free.clear()
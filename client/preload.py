@@ -0,0 +1,254 @@
+"""
+The client's resource files, listed with their content hashes in resources/manifest.json:
+
+    {"version": 1, "files": {"images/green.png": {"size": 1234, "sha256": "..."}, "audio/hit.wav": {...}}}
+
+Names are paths relative to the resources directory. The manifest ships with the client, so a missing or damaged
+install is noticed at startup instead of when a file is first used. If it is missing, as in a checkout, one is written
+from the files that are there.
+
+A Preloader reads, checks and decodes every listed file on a worker thread while the loading screen is up. Decoded
+images are kept in an LRU cache shared by every Asset, so no image is decoded on the main thread mid game.
+"""
+import hashlib
+import io
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from client import headless
+
+if headless.ENABLED:
+    from client.headless import decode_png, load_image as _load
+else:
+    import pyglet
+
+    def _load(name: str):
+        # Not pyglet.resource.image, which keeps every image it ever loaded.
+        return pyglet.image.load(name, file=pyglet.resource.file(name)).get_texture()
+
+
+MANIFEST_VERSION = 1
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+AUDIO_SUFFIXES = ('.wav', '.ogg', '.mp3', '.flac')
+
+
+class Manifest:
+    """
+    Every image and sound file the client uses, with its size and SHA-256.
+    """
+
+    def __init__(self, files: {str: {}} = None):
+        """
+        :param files: {name: {'size': bytes, 'sha256': hex digest}}, names relative to the resources directory.
+        """
+        self.files: {str: {}} = files or {}
+
+    def __len__(self):
+        return len(self.files)
+
+    def __contains__(self, name: str):
+        return name in self.files
+
+    @staticmethod
+    def scan(root: Path):
+        """
+        Makes a manifest of the image and audio files under a resources directory as they are now.
+        """
+        root = Path(root)
+        files = {}
+        for directory, suffixes in (('images', IMAGE_SUFFIXES), ('audio', AUDIO_SUFFIXES)):
+            for file in sorted(root.joinpath(directory).rglob('*')):
+                if file.is_file() and file.suffix.lower() in suffixes:
+                    data = file.read_bytes()
+                    files[file.relative_to(root).as_posix()] = {'size': len(data),
+                                                                'sha256': hashlib.sha256(data).hexdigest()}
+        return Manifest(files)
+
+    @staticmethod
+    def read(path: Path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if data.get('version', 0) > MANIFEST_VERSION:
+            raise ValueError(f'{path} was written by a newer client.')
+        return Manifest(data['files'])
+
+    def write(self, path: Path):
+        with open(path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'files': self.files}, f, indent=1, sort_keys=True)
+
+    def missing(self, root: Path) -> [str]:
+        """
+        Gives the listed files that aren't under root or have the wrong size. Only stats the files, the hashes are
+        checked as the Preloader reads them.
+        """
+        root = Path(root)
+        result = []
+        for name, entry in self.files.items():
+            file = root.joinpath(name)
+            if not file.is_file() or file.stat().st_size != entry['size']:
+                result.append(name)
+        return result
+
+    def matches(self, name: str, data: bytes) -> bool:
+        return hashlib.sha256(data).hexdigest() == self.files[name]['sha256']
+
+
+class ImageCache:
+    """
+    Decoded images by resource name (as given to pyglet.resource), least recently used ones dropped first once they
+    take up more than max_bytes. Dropping an image only frees it once no sprite uses it any more.
+    Not thread safe, it is only used from the main thread.
+    """
+
+    def __init__(self, loader: callable, max_bytes: int = 256 * 1024 * 1024):
+        """
+        :param loader: called with a name to load an image that isn't cached.
+        :param max_bytes: most decoded pixel data kept, counted as 4 bytes a pixel.
+        """
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._images: OrderedDict = OrderedDict()
+
+    def __len__(self):
+        return len(self._images)
+
+    def __contains__(self, name: str):
+        return name in self._images
+
+    def get(self, name: str):
+        """
+        Gives an image, loading it on the spot if it isn't cached.
+        """
+        image = self._images.get(name)
+        if image is not None:
+            self.hits += 1
+            self._images.move_to_end(name)
+            return image
+        self.misses += 1
+        image = self.loader(name)
+        self.put(name, image)
+        return image
+
+    def put(self, name: str, image):
+        old = self._images.pop(name, None)
+        if old is not None:
+            self.size -= ImageCache._bytes(old)
+        self._images[name] = image
+        self.size += ImageCache._bytes(image)
+        while self.size > self.max_bytes and len(self._images) > 1:
+            _, dropped = self._images.popitem(last=False)
+            self.size -= ImageCache._bytes(dropped)
+
+    def clear(self):
+        self._images.clear()
+        self.size = 0
+
+    @staticmethod
+    def _bytes(image) -> int:
+        return image.width * image.height * 4
+
+
+images = ImageCache(_load)  # shared by every Asset
+
+
+class Preloader:
+    """
+    Reads every file in a Manifest on a worker thread, checks it against its hash and decodes it. Images are turned
+    into textures on the main thread by pump, a few at a time so the loading screen keeps drawing, and put in the
+    image cache. Sounds are kept in sounds, fully decoded.
+    """
+
+    def __init__(self, root: Path, manifest: Manifest, cache: ImageCache = images):
+        """
+        :param root: the resources directory the manifest's names are relative to.
+        :param cache: image cache the decoded images go into.
+        """
+        self.root = Path(root)
+        self.manifest = manifest
+        self.cache = cache
+        self.sounds: {str: object} = {}
+        self.changed: [str] = []  # files whose contents don't match the manifest, they are still loaded
+        self.failed: [str] = []
+        self.loaded = 0
+        self._decoded = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._decode_all, name='Preloader', daemon=True)
+
+    @property
+    def total(self) -> int:
+        return len(self.manifest)
+
+    @property
+    def done(self) -> bool:
+        return self.loaded == self.total
+
+    @property
+    def progress(self) -> float:
+        return self.loaded / self.total if self.total else 1.0
+
+    def start(self):
+        self._thread.start()
+
+    def close(self):
+        """
+        Stops decoding, anything not decoded yet is loaded when it is first used instead.
+        """
+        self._stopped.set()
+
+    def pump(self, budget: float = 1 / 60) -> bool:
+        """
+        Finishes loading decoded files on the main thread for up to budget seconds, waiting for the worker thread when
+        nothing is decoded yet.
+        :return: whether everything is loaded.
+        """
+        deadline = time.perf_counter() + budget
+        while not self.done:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                name, resource = self._decoded.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if resource is None:
+                self.failed.append(name)
+            elif name.startswith('audio/'):
+                self.sounds[Path(name).name] = resource
+            else:
+                texture = resource if headless.ENABLED else resource.get_texture()
+                self.cache.put(Path(name).name, texture)
+            self.loaded += 1
+        return self.done
+
+    def _decode_all(self):
+        for name in self.manifest.files:
+            if self._stopped.is_set():
+                return
+            try:
+                data = self.root.joinpath(name).read_bytes()
+                if not self.manifest.matches(name, data):
+                    self.changed.append(name)
+                resource = Preloader._decode(name, data)
+            except Exception as e:
+                print(f'Could not load {name}: {e}')
+                resource = None
+            self._decoded.put((name, resource))
+
+    @staticmethod
+    def _decode(name: str, data: bytes):
+        # Runs on the worker thread, so only decoding that doesn't need the GL context happens here.
+        file_name = Path(name).name
+        if name.startswith('audio/'):
+            if headless.ENABLED:
+                return data
+            return pyglet.media.load(file_name, file=io.BytesIO(data), streaming=False)
+        if headless.ENABLED:
+            return decode_png(data)
+        return pyglet.image.load(file_name, file=io.BytesIO(data))
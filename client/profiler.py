@@ -0,0 +1,86 @@
+import csv
+import json
+from collections import deque
+from pathlib import Path
+from time import perf_counter
+
+
+class FrameProfiler:
+    """
+    Times each phase of a frame (broadphase, narrowphase, physics, draw, ...) and keeps rolling percentiles per phase.
+    Time recorded for a phase is summed until end_frame, so several simulation steps in one frame count together.
+    """
+
+    def __init__(self, window: int = 240, trace_path: str = None):
+        """
+        :param window: number of recent frames the percentiles are taken over.
+        :param trace_path: optional file that every frame's phase timings are written to. A .json path is written
+        when the profiler is closed, anything else is streamed as CSV.
+        """
+        self.window = window
+        self.frame = 0
+        self.samples: {str: deque} = {}
+        self._current: {str: float} = {}
+        self._trace_path = Path(trace_path) if trace_path else None
+        self._trace_rows: [dict] = []
+        self._csv_file = None
+        self._csv = None
+        if self._trace_path and self._trace_path.suffix.lower() != '.json':
+            self._csv_file = open(self._trace_path, 'w', newline='')
+            self._csv = csv.writer(self._csv_file)
+            self._csv.writerow(('frame', 'phase', 'ms'))
+
+    @staticmethod
+    def now() -> float:
+        return perf_counter()
+
+    def record(self, phase: str, seconds: float):
+        """
+        Adds time spent in a phase to the current frame.
+        """
+        self._current[phase] = self._current.get(phase, 0.0) + seconds
+
+    def end_frame(self):
+        """
+        Closes the current frame, pushing its phase totals into the rolling windows and the trace file.
+        """
+        for phase, seconds in self._current.items():
+            samples = self.samples.get(phase)
+            if samples is None:
+                samples = self.samples[phase] = deque(maxlen=self.window)
+            samples.append(seconds)
+            if self._csv:
+                self._csv.writerow((self.frame, phase, round(seconds * 1000, 4)))
+            elif self._trace_path:
+                self._trace_rows.append({'frame': self.frame, 'phase': phase, 'ms': round(seconds * 1000, 4)})
+        self._current.clear()
+        self.frame += 1
+
+    def percentiles(self, phase: str, percents: (float,) = (50, 95, 99)) -> (float,):
+        """
+        Gives the given percentiles of a phase's recent frame times, in milliseconds.
+        """
+        samples = sorted(self.samples.get(phase, ()))
+        if not samples:
+            return tuple(0.0 for _ in percents)
+        last = len(samples) - 1
+        return tuple(samples[round(last * percent / 100)] * 1000 for percent in percents)
+
+    def report(self, percents: (float,) = (50, 95, 99)) -> {str: (float,)}:
+        """
+        Gives the percentiles of every phase seen so far, in milliseconds.
+        """
+        return {phase: self.percentiles(phase, percents) for phase in self.samples}
+
+    def close(self):
+        """
+        Finishes the trace file, if there is one.
+        """
+        if self._csv_file:
+            self._csv_file.close()
+            self._csv_file = self._csv = None
+        elif self._trace_path:
+            with open(self._trace_path, 'w') as f:
+                json.dump(self._trace_rows, f)
+            self._trace_path = None
+            self._trace_rows = []
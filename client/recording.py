@@ -0,0 +1,170 @@
+"""
+Recordings of client sessions: the simulated world, per frame input and frame times, so a session can be replayed
+exactly, without a window, by client.replay.
+
+A recording is a header followed by records, each starting with a one byte tag:
+
+    ADD     a Collidable entering the simulation, with its collider, velocity, mass and, for Players, speed and keys
+    REMOVE  a Collidable leaving it
+    FRAME   the real frame time the fixed timestep was ticked with and, for every Player, a byte of held keys
+
+The simulation only ever steps by the fixed step, so the frame times and key states are all a replay needs to run
+the same steps in the same order. Positions set directly mid session (teleports) are not recorded.
+"""
+import struct
+from pathlib import Path
+
+from client.colliders import POLY
+from client.logic import Collidable, PhysicsBody, Player
+from client.timestep import FixedTimestep
+
+MAGIC = b'INVR'
+FORMAT_VERSION = 1
+
+ADD = 1
+REMOVE = 2
+FRAME = 3
+
+STATIC = 0
+BODY = 1
+PLAYER = 2
+CONTINUOUS = 0x80  # set on the kind of bodies with continuous collision
+
+UP = 1
+DOWN = 2
+LEFT = 4
+RIGHT = 8
+
+_HEADER = struct.Struct('>4sHdHII')  # magic, format version, step, max steps, window width, window height
+_TAG = struct.Struct('>B')
+_ADD = struct.Struct('>IBBdddddddH')  # id, kind, shape, x, y, dx, dy, mass, speed, radius, vertex count
+_KEYS = struct.Struct('>IIII')  # up, down, left, right key symbols
+_REMOVE = struct.Struct('>I')
+_FRAME = struct.Struct('>dH')  # frame time, player count
+
+
+class Recorder:
+    """
+    Writes a session to a recording file as it is played. Starts with everything already in the simulation, then
+    follows it through Simulation.recorder. frame must be called with every frame time the timestep is ticked with.
+    """
+
+    def __init__(self, path: Path, simulation, timestep: FixedTimestep):
+        """
+        :param path: the file to write, replaced if it exists.
+        :param simulation: the Simulation to record.
+        :param timestep: the FixedTimestep stepping the simulation.
+        """
+        self.path = Path(path)
+        self.simulation = simulation
+        self.frames = 0
+        self._ids: {Collidable: int} = {}
+        self._next_id = 0
+        self._file = open(self.path, 'wb')
+        self._file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, timestep.step, timestep.max_steps,
+                                      simulation.physics_world.window_width, simulation.physics_world.window_height))
+        for collidable in simulation.collidables:
+            self.added(collidable)
+        simulation.recorder = self
+
+    def added(self, collidable: Collidable):
+        collidable_id = self._next_id
+        self._next_id += 1
+        self._ids[collidable] = collidable_id
+        collider = collidable.collider
+        if isinstance(collidable, Player):
+            kind = PLAYER
+        elif isinstance(collidable, PhysicsBody):
+            kind = BODY
+        else:
+            kind = STATIC
+        offsets = collider.hull_offsets() if collider.kind == POLY else []
+        dx = collidable.dx if kind != STATIC else None
+        flags = CONTINUOUS if kind != STATIC and collidable.continuous else 0
+        parts = [_TAG.pack(ADD), _ADD.pack(collidable_id, kind | flags, collider.kind,
+                                           collidable.rel_x, collidable.rel_y,
+                                           dx.x if dx else 0.0, dx.y if dx else 0.0,
+                                           collidable.mass if kind != STATIC else 0.0,
+                                           collidable.speed if kind == PLAYER else 0.0, collider.radius,
+                                           len(offsets))]
+        if offsets:
+            parts.append(struct.pack(f'>{len(offsets) * 2}d', *[value for offset in offsets for value in offset]))
+        if kind == PLAYER:
+            binds = collidable.key_binds
+            parts.append(_KEYS.pack(binds.up, binds.down, binds.left, binds.right))
+        self._file.write(b''.join(parts))
+
+    def removed(self, collidable: Collidable):
+        self._file.write(_TAG.pack(REMOVE) + _REMOVE.pack(self._ids.pop(collidable)))
+
+    def frame(self, dt: float):
+        """
+        Records one frame: its time and the keys every Player holds going into it.
+        """
+        players = self.simulation.players
+        self._file.write(_TAG.pack(FRAME) + _FRAME.pack(dt, len(players)) +
+                         bytes(key_state(player) for player in players))
+        self.frames += 1
+
+    def close(self):
+        if self.simulation.recorder is self:
+            self.simulation.recorder = None
+        self._file.close()
+
+
+def key_state(player: Player) -> int:
+    """
+    Packs the movement keys a Player holds into UP, DOWN, LEFT and RIGHT bits.
+    """
+    handler = player.key_handler
+    binds = player.key_binds
+    return ((UP if handler[binds.up] else 0) | (DOWN if handler[binds.down] else 0) |
+            (LEFT if handler[binds.left] else 0) | (RIGHT if handler[binds.right] else 0))
+
+
+class Recording:
+    """
+    A recording read back into memory.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self.data = f.read()
+        magic, version, self.step, self.max_steps, self.window_width, self.window_height = \
+            _HEADER.unpack_from(self.data)
+        if magic != MAGIC or version > FORMAT_VERSION:
+            raise ValueError(f'{self.path} is not a recording this version can read')
+
+    def __iter__(self):
+        """
+        Yields the records in order, as
+        (ADD, id, kind and CONTINUOUS flag, shape, x, y, dx, dy, mass, speed, radius, offsets, keys),
+        (REMOVE, id) and (FRAME, dt, key states).
+        """
+        data = self.data
+        offset = _HEADER.size
+        while offset < len(data):
+            tag = data[offset]
+            offset += _TAG.size
+            if tag == ADD:
+                collidable_id, kind, shape, x, y, dx, dy, mass, speed, radius, count = _ADD.unpack_from(data, offset)
+                offset += _ADD.size
+                values = struct.unpack_from(f'>{count * 2}d', data, offset)
+                offset += count * 16
+                offsets = list(zip(values[::2], values[1::2]))
+                keys = None
+                if kind & ~CONTINUOUS == PLAYER:
+                    keys = _KEYS.unpack_from(data, offset)
+                    offset += _KEYS.size
+                yield ADD, collidable_id, kind, shape, x, y, dx, dy, mass, speed, radius, offsets, keys
+            elif tag == REMOVE:
+                yield REMOVE, _REMOVE.unpack_from(data, offset)[0]
+                offset += _REMOVE.size
+            elif tag == FRAME:
+                dt, count = _FRAME.unpack_from(data, offset)
+                offset += _FRAME.size
+                yield FRAME, dt, data[offset:offset + count]
+                offset += count
+            else:
+                raise ValueError(f'Unknown record {tag} at byte {offset - 1} of {self.path}')
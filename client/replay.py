@@ -0,0 +1,137 @@
+"""
+Replays a recorded client session without a window, as fast as it will run.
+
+    python -m client.replay session.rec
+    python -m client.replay session.rec --phases --worst 10
+    python -m client.replay session.rec --expect 3f9a...
+
+Frames are fed through the same FixedTimestep, Players, PhysicsWorld and collision code as the client, so the
+recorded session's slow frames can be profiled offline. The digest printed at the end hashes every body's position
+after every frame; two builds of the simulation that print the same digest moved everything identically, and with
+--expect the run exits non-zero when the digest differs.
+"""
+import argparse
+import hashlib
+import sys
+import time
+
+from client import headless
+
+headless.enable()
+
+from collision import Vector  # noqa: E402
+
+from client.colliders import CIRCLE, POINT  # noqa: E402
+from client.headless import Image  # noqa: E402
+from client.logic import Collidable, KeyMap, PhysicsBody, Player  # noqa: E402
+from client.profiler import FrameProfiler  # noqa: E402
+from client.recording import (ADD, BODY, CONTINUOUS, DOWN, FRAME, LEFT, PLAYER, REMOVE, RIGHT,  # noqa: E402
+                              UP, Recording)
+from client.simulation import Simulation  # noqa: E402
+from client.timestep import FixedTimestep  # noqa: E402
+
+
+def replay(recording: Recording, phases: bool = False) -> dict:
+    """
+    Runs a recording through a fresh simulation and gives its measurements.
+    :param phases: also time each phase of the tick with a FrameProfiler, at some cost to speed.
+    """
+    simulation = Simulation(recording.window_width, recording.window_height)
+    if phases:
+        simulation.profiler = FrameProfiler(window=1 << 20)
+    timestep = FixedTimestep(simulation.step, recording.step, recording.max_steps)
+    world = simulation.physics_world
+    size = {'window_width': recording.window_width, 'window_height': recording.window_height, 'img': Image(1, 1)}
+    collidables: {int: Collidable} = {}
+    digest = hashlib.sha256()
+    frame_costs: [(float, int, float, int)] = []  # (seconds, frame, recorded dt, steps)
+    frames = steps = 0
+    recorded_time = 0.0
+
+    start = time.perf_counter()
+    for record in recording:
+        tag = record[0]
+        if tag == FRAME:
+            _, dt, key_states = record
+            for player, state in zip(simulation.players, key_states):
+                handler = player.key_handler
+                binds = player.key_binds
+                handler[binds.up] = bool(state & UP)
+                handler[binds.down] = bool(state & DOWN)
+                handler[binds.left] = bool(state & LEFT)
+                handler[binds.right] = bool(state & RIGHT)
+            frame_start = time.perf_counter()
+            ran = timestep.tick(dt)
+            frame_costs.append((time.perf_counter() - frame_start, frames, dt, ran))
+            if phases:
+                simulation.profiler.end_frame()
+            digest.update(world.pos[:len(world)].tobytes())
+            frames += 1
+            steps += ran
+            recorded_time += dt
+        elif tag == ADD:
+            _, collidable_id, kind, shape, x, y, dx, dy, mass, speed, radius, offsets, keys = record
+            if shape == CIRCLE:
+                collider = {'radius': radius}
+            elif shape == POINT:
+                collider = {'points': ((0.0, 0.0),)}
+            else:
+                collider = {'points': offsets}
+            position = Vector(x, y)
+            continuous = bool(kind & CONTINUOUS)
+            kind &= ~CONTINUOUS
+            if kind == PLAYER:
+                collidable = Player(speed=speed, key_map=KeyMap(*keys), dx=Vector(dx, dy), mass=mass,
+                                    continuous=continuous, rel_pos_vector=position, **collider, **size)
+            elif kind == BODY:
+                collidable = PhysicsBody(dx=Vector(dx, dy), mass=mass, continuous=continuous, rel_pos_vector=position,
+                                         **collider, **size)
+            else:
+                collidable = Collidable(rel_pos_vector=position, **collider, **size)
+            collidables[collidable_id] = collidable
+            simulation.add(collidable)
+        elif tag == REMOVE:
+            collidable = collidables.pop(record[1])
+            simulation.remove(collidable)
+            collidable.delete()
+    elapsed = time.perf_counter() - start
+
+    result = {
+        'frames': frames,
+        'steps': steps,
+        'recorded_seconds': recorded_time,
+        'replay_seconds': elapsed,
+        'steps_per_second': steps / elapsed if elapsed else float('inf'),
+        'worst_frames': sorted(frame_costs, reverse=True),
+        'digest': digest.hexdigest(),
+    }
+    if phases:
+        result['phase_percentiles_ms'] = simulation.profiler.report()
+    return result
+
+
+def main(argv: [str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recording', help='file written by the client with the record setting')
+    parser.add_argument('--phases', action='store_true', help='break tick time down by phase')
+    parser.add_argument('--worst', type=int, default=5, help='number of slowest frames to list')
+    parser.add_argument('--expect', default=None, help='fail if the trajectory digest is not this')
+    args = parser.parse_args(argv)
+
+    result = replay(Recording(args.recording), args.phases)
+    print(f'{result["frames"]} frames, {result["steps"]} steps, {result["recorded_seconds"]:.1f} s recorded')
+    print(f'  replayed in:   {result["replay_seconds"]:.3f} s')
+    print(f'  steps/second:  {result["steps_per_second"]:.1f}')
+    for seconds, frame, dt, steps in result['worst_frames'][:args.worst]:
+        print(f'  frame {frame:<8} {seconds * 1000:8.3f} ms to replay, {dt * 1000:.1f} ms recorded, {steps} steps')
+    for phase, (p50, p95, p99) in sorted(result.get('phase_percentiles_ms', {}).items()):
+        print(f'  {phase:<12} p50 {p50:.3f} ms, p95 {p95:.3f} ms, p99 {p99:.3f} ms')
+    print(f'  digest:        {result["digest"]}')
+    if args.expect is not None and result['digest'] != args.expect:
+        print(f'Trajectories differ from {args.expect}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
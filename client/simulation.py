@@ -0,0 +1,163 @@
+from collision import Vector
+
+from client.broadphase import SpatialHash, StaticIndex
+from client.contacts import ContactManager
+from client.continuous import sweep
+from client.logic import Collidable, PhysicsBody, Player
+from client.physics import PhysicsWorld
+from client.profiler import FrameProfiler
+
+
+class Simulation:
+    """
+    Everything in the client that advances once per tick, independent of drawing.
+    Used by the client window as well as headless benchmarks.
+    """
+
+    def __init__(self, window_width: int, window_height: int):
+        """
+        :param window_width: width of the window the simulated objects are drawn in.
+        :param window_height: height of the window the simulated objects are drawn in.
+        """
+        self.collidables: {Collidable: None} = {}  # dicts are used as ordered sets so removal is O(1)
+        self.statics: {Collidable: None} = {}
+        self.physics_objects: {PhysicsBody: None} = {}
+        self.continuous: {PhysicsBody: None} = {}  # bodies whose moves are swept against static geometry
+        self.players: {Player: None} = {}
+        self.spatial_hash = SpatialHash()  # dynamic layer, updated as bodies move
+        self.static_index = StaticIndex()  # static layer, rebuilt only when static geometry is added or removed
+        self._static_dirty = False
+        self.physics_world = PhysicsWorld(window_width, window_height)
+        self.contacts = ContactManager()  # begin/persist/end contact events and separation of overlapping bodies
+        self.collision_checks = 0  # narrowphase tests run in the last step
+        self.profiler: FrameProfiler = None  # times each phase of step when set
+        self.recorder = None  # a Recorder told about every Collidable added or removed, when set
+
+    def add(self, collidable: Collidable):
+        """
+        Starts simulating a Collidable, along with its physics and input if it has any.
+        Collidables without physics are treated as static and go into the static index.
+        """
+        self.collidables[collidable] = None
+        if isinstance(collidable, PhysicsBody):
+            self.spatial_hash.insert(collidable)
+            self.physics_objects[collidable] = None
+            self.physics_world.add(collidable)
+            if collidable.continuous:
+                self.continuous[collidable] = None
+        else:
+            self.statics[collidable] = None
+            self._static_dirty = True
+        if isinstance(collidable, Player):
+            self.players[collidable] = None
+        if self.recorder:
+            self.recorder.added(collidable)
+
+    def remove(self, collidable: Collidable):
+        """
+        Stops simulating a Collidable.
+        """
+        del self.collidables[collidable]
+        self.contacts.forget(collidable)
+        if isinstance(collidable, PhysicsBody):
+            self.spatial_hash.remove(collidable)
+            del self.physics_objects[collidable]
+            self.continuous.pop(collidable, None)
+            self.physics_world.remove(collidable)
+        else:
+            del self.statics[collidable]
+            self._static_dirty = True
+        if isinstance(collidable, Player):
+            del self.players[collidable]
+        if self.recorder:
+            self.recorder.removed(collidable)
+
+    def pairs(self):
+        """
+        Yields each candidate pair for the narrowphase once: dynamic-vs-dynamic, then dynamic-vs-static.
+        Static-vs-static pairs are never tested.
+        """
+        self._refresh_static_index()
+        yield from self.spatial_hash.pairs()
+        static_index = self.static_index
+        if static_index:
+            for body in self.physics_objects:
+                for static in static_index.candidates(body.cells):
+                    yield body, static
+
+    def query(self, cells) -> {Collidable}:
+        """
+        Gives every Collidable, moving or static, that occupies at least one of the given grid cells.
+        """
+        self._refresh_static_index()
+        result = self.spatial_hash.query(cells)
+        result.update(self.static_index.candidates(cells))
+        return result
+
+    def step(self, dt: float):
+        """
+        Advances the simulation by one tick of dt seconds.
+        """
+        profiler = self.profiler
+        if profiler:
+            start = profiler.now()
+            # Pairs are only gathered up front when profiling, so that broadphase and narrowphase time separately.
+            pairs = list(self.pairs())
+            mark = profiler.now()
+            profiler.record('broadphase', mark - start)
+            start = mark
+        else:
+            pairs = self.pairs()
+        checks = 0
+        contacts = self.contacts
+        for collidable, collidable2 in pairs:
+            checks += 1
+            response = collidable.is_colliding(collidable2)
+            if response:
+                contacts.contact(collidable, collidable2, response)
+        contacts.end_tick()
+        self.collision_checks = checks
+        if profiler:
+            mark = profiler.now()
+            profiler.record('narrowphase', mark - start)
+            start = mark
+        for player in self.players:
+            player.handle_input()
+        self.physics_world.step(dt)
+        if self.continuous:
+            self._sweep()
+        if profiler:
+            mark = profiler.now()
+            profiler.record('physics', mark - start)
+            start = mark
+        for physics_object in self.physics_objects:
+            self.spatial_hash.update(physics_object)
+        if profiler:
+            profiler.record('broadphase', profiler.now() - start)
+
+    def _sweep(self):
+        # Pulls continuous bodies that moved far this step back to where they first touched static geometry.
+        self._refresh_static_index()
+        static_index = self.static_index
+        if not static_index:
+            return
+        world = self.physics_world
+        offsets = {}
+        for body in self.continuous:
+            move_x, move_y = world.displacement(body)
+            (min_x, min_y), (max_x, max_y) = body.aabb
+            if abs(move_x) * 2 < max_x - min_x and abs(move_y) * 2 < max_y - min_y:
+                continue
+            start = ((min_x - move_x, min_y - move_y), (max_x - move_x, max_y - move_y))
+            moved_x, moved_y, blocked_x, blocked_y = sweep(start, move_x, move_y, static_index)
+            if moved_x != move_x or moved_y != move_y:
+                offsets[body] = [moved_x - move_x, moved_y - move_y]
+                if blocked_x or blocked_y:
+                    dx = body.dx
+                    body.dx = Vector(0 if blocked_x else dx.x, 0 if blocked_y else dx.y)
+        world.nudge(offsets)
+
+    def _refresh_static_index(self):
+        if self._static_dirty:
+            self.static_index = StaticIndex(list(self.statics))
+            self._static_dirty = False
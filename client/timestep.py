@@ -0,0 +1,44 @@
+class FixedTimestep:
+    """
+    Runs a simulation callback at a fixed rate no matter how often it is ticked.
+    Frame time is banked in an accumulator and paid out in whole steps, so the simulation always sees the same dt.
+    """
+
+    def __init__(self, callback: callable, step: float = 1 / 120, max_steps: int = 8):
+        """
+        :param callback: called with the fixed step, in seconds, once per simulation step.
+        :param step: length of one simulation step in seconds.
+        :param max_steps: most simulation steps run per tick. Any time still banked past this is dropped, so a slow
+        frame can't make the next one slower (the "spiral of death").
+        """
+        self.callback = callback
+        self.step = step
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.dropped_time = 0.0  # total simulation time discarded by the max_steps cap, in seconds
+
+    @property
+    def alpha(self) -> float:
+        """
+        How far between the last two simulation states the current frame falls, from 0 to 1.
+        Used to interpolate what is drawn.
+        """
+        return self.accumulator / self.step
+
+    def tick(self, dt: float) -> int:
+        """
+        Banks dt and runs as many whole simulation steps as it pays for.
+        :param dt: real time passed since the last tick, in seconds.
+        :return: the number of simulation steps run.
+        """
+        self.accumulator += dt
+        steps = 0
+        while self.accumulator >= self.step:
+            if steps == self.max_steps:
+                self.dropped_time += self.accumulator - self.accumulator % self.step
+                self.accumulator %= self.step
+                break
+            self.callback(self.step)
+            self.accumulator -= self.step
+            steps += 1
+        return steps
@@ -0,0 +1,180 @@
+"""
+Binary state sync protocol shared by the client and the server.
+
+The server streams entity state (position in the 16x9 relative space and health) to each client as length-prefixed
+frames over TCP. The first frame a client gets is a snapshot of every entity. After that each frame is a delta against
+the previous frame sent to that client: only entities that changed, and only the fields that changed. Positions are
+quantized to 1/256 of a relative unit, which is well under a pixel at 4K. Position changes are sent as 16 bit
+quantized offsets. A full 32 bit position is sent only when an entity appears or jumps more than 128 units.
+
+Frame layout, big endian:
+    frame:    length (H), header, entities
+    header:   kind (B), sequence (H), entity count (H)
+    snapshot: per entity id (H), x (i), y (i), health (H)
+    delta:    per entity id (H), mask (B), then the fields the mask names, in mask bit order
+"""
+import struct
+
+QUANTUM = 256  # quantization steps per relative unit
+
+SNAPSHOT = 0
+DELTA = 1
+
+MASK_X = 1  # x offset (h)
+MASK_Y = 2  # y offset (h)
+MASK_HEALTH = 4  # health (H)
+MASK_ABSOLUTE = 8  # x (i), y (i), health (H), for new entities and big jumps
+MASK_REMOVED = 16  # entity is gone, no fields
+
+LENGTH = struct.Struct('>H')
+MAX_PAYLOAD = 0xFFFF  # most bytes a frame can carry, set by the length prefix
+HEADER = struct.Struct('>BHH')
+_FULL = struct.Struct('>HiiH')
+_ENTITY = struct.Struct('>HB')
+_ABSOLUTE = struct.Struct('>iiH')
+_OFFSET = struct.Struct('>h')
+_HEALTH = struct.Struct('>H')
+_OFFSET_LIMIT = 1 << 15
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def quantize(x: float, y: float, health: int) -> (int, int, int):
+    """
+    Turns relative coordinates and health into the integers sent on the wire.
+    """
+    return round(x * QUANTUM), round(y * QUANTUM), max(0, min(0xFFFF, int(health)))
+
+
+def dequantize(state: (int, int, int)) -> (float, float, int):
+    return state[0] / QUANTUM, state[1] / QUANTUM, state[2]
+
+
+def frame(payload: bytes) -> bytes:
+    """
+    Prefixes a payload with its length for sending over a stream.
+    """
+    if len(payload) > MAX_PAYLOAD:
+        raise ProtocolError(f'Frame of {len(payload)} bytes is too big to send')
+    return LENGTH.pack(len(payload)) + payload
+
+
+class StateEncoder(object):
+    """
+    Encodes entity states for one client, as deltas against what that client was last sent.
+    """
+
+    def __init__(self):
+        self.sequence = 0
+        self.baseline: {int: (int, int, int)} = None  # quantized states last sent, None until the first snapshot
+
+    def reset(self):
+        """
+        Makes the next frame a full snapshot.
+        """
+        self.baseline = None
+
+    def encode(self, states: {int: (int, int, int)}) -> bytes:
+        """
+        :param states: quantized (x, y, health) of every entity by 16 bit entity id, see quantize.
+        :return: the frame payload. It becomes the baseline for the next one, so it must be sent.
+        :raises ProtocolError: if the payload doesn't fit in a frame. Nothing changes then, the next frame is encoded
+        against the same baseline.
+        """
+        sequence = (self.sequence + 1) & 0xFFFF
+        if self.baseline is None:
+            parts = [HEADER.pack(SNAPSHOT, sequence, len(states))]
+            parts.extend(_FULL.pack(eid, x, y, health) for eid, (x, y, health) in states.items())
+        else:
+            parts = [b'']
+            count = 0
+            baseline = self.baseline
+            for eid, state in states.items():
+                old = baseline.get(eid)
+                if old == state:
+                    continue
+                count += 1
+                x, y, health = state
+                if old is None or abs(x - old[0]) >= _OFFSET_LIMIT or abs(y - old[1]) >= _OFFSET_LIMIT:
+                    parts.append(_ENTITY.pack(eid, MASK_ABSOLUTE) + _ABSOLUTE.pack(x, y, health))
+                    continue
+                mask = 0
+                fields = []
+                if x != old[0]:
+                    mask |= MASK_X
+                    fields.append(_OFFSET.pack(x - old[0]))
+                if y != old[1]:
+                    mask |= MASK_Y
+                    fields.append(_OFFSET.pack(y - old[1]))
+                if health != old[2]:
+                    mask |= MASK_HEALTH
+                    fields.append(_HEALTH.pack(health))
+                parts.append(_ENTITY.pack(eid, mask))
+                parts.extend(fields)
+            for eid in baseline.keys() - states.keys():
+                count += 1
+                parts.append(_ENTITY.pack(eid, MASK_REMOVED))
+            parts[0] = HEADER.pack(DELTA, sequence, count)
+        payload = b''.join(parts)
+        if len(payload) > MAX_PAYLOAD:
+            raise ProtocolError(f'Frame of {len(payload)} bytes for {len(states)} entities is too big to send')
+        self.sequence = sequence
+        self.baseline = dict(states)
+        return payload
+
+
+class StateDecoder(object):
+    """
+    Rebuilds the full entity state on the client from a stream of snapshot and delta payloads.
+    """
+
+    def __init__(self):
+        self.sequence: int = None
+        self.states: {int: (int, int, int)} = {}  # quantized
+
+    def decode(self, payload: bytes) -> {int: (float, float, int)}:
+        """
+        Applies a payload and gives the resulting (x, y, health) of every entity, in relative units.
+        """
+        kind, sequence, count = HEADER.unpack_from(payload)
+        offset = HEADER.size
+        if kind == SNAPSHOT:
+            states = {}
+            for _ in range(count):
+                eid, x, y, health = _FULL.unpack_from(payload, offset)
+                offset += _FULL.size
+                states[eid] = (x, y, health)
+        elif kind == DELTA:
+            if self.sequence is None:
+                raise ProtocolError('Delta received before a snapshot')
+            if sequence != (self.sequence + 1) & 0xFFFF:
+                raise ProtocolError(f'Expected frame {(self.sequence + 1) & 0xFFFF}, got {sequence}')
+            states = self.states
+            for _ in range(count):
+                eid, mask = _ENTITY.unpack_from(payload, offset)
+                offset += _ENTITY.size
+                if mask & MASK_REMOVED:
+                    states.pop(eid, None)
+                    continue
+                if mask & MASK_ABSOLUTE:
+                    states[eid] = _ABSOLUTE.unpack_from(payload, offset)
+                    offset += _ABSOLUTE.size
+                    continue
+                x, y, health = states[eid]
+                if mask & MASK_X:
+                    x += _OFFSET.unpack_from(payload, offset)[0]
+                    offset += _OFFSET.size
+                if mask & MASK_Y:
+                    y += _OFFSET.unpack_from(payload, offset)[0]
+                    offset += _OFFSET.size
+                if mask & MASK_HEALTH:
+                    health = _HEALTH.unpack_from(payload, offset)[0]
+                    offset += _HEALTH.size
+                states[eid] = (x, y, health)
+        else:
+            raise ProtocolError(f'Unknown frame kind {kind}')
+        self.sequence = sequence
+        self.states = states
+        return {eid: dequantize(state) for eid, state in states.items()}
@@ -1,26 +1,28 @@
 import asyncio
-import pickle
+import configparser
 import json
 import os
 from pathlib import Path
 
 import discord
 
-from server.storage import Player, Game
+from server.engine import GameEngine
+from server.leaderboard import Leaderboard
+from server.matchmaking import Matchmaker
+from server.persistence import Journal, atomic_write
+from server.router import CommandRouter
+from server.scheduler import CommandScheduler
+from server.storage import Player, Game, Repository
 
 __version__ = 'v0.1beta'
 
-commands: {callable} = {}
+router = CommandRouter()
 save_actions: [callable] = []
 
 
-def command(aliases: [str] = None, hidden: bool = False):
+def command(aliases: [str] = None, hidden: bool = False, heavy: bool = False):
     def decorator(function: callable):
-        function.hidden = hidden
-        commands[function.__name__] = function
-        if aliases:
-            for alias in aliases:
-                commands[alias] = function
+        router.register(function, aliases, hidden, heavy)
         return function
 
     return decorator
@@ -54,66 +56,167 @@ def start():
 
     default_prefix = '*'
     auto_save_duration = 300  # in seconds
-    admins: []
+    max_heavy_commands = 8  # heavy commands running at once across all guilds
+    user_command_rate = 5  # commands a user may send per user_command_period
+    user_command_period = 10  # in seconds
+    game_tick_rate = 20  # active game ticks per second
+    challenge_ttl = 120  # seconds a challenge stays open
+    matchmaking_interval = 0.5  # seconds between batches of games started from accepted challenges
 
     data_path = Path('data/')
+    config_file = data_path.joinpath('config.ini')
     prefix_file = data_path.joinpath('prefixes.json')
     admin_file = data_path.joinpath('admins.json')
+    member_file = data_path.joinpath('members.json')
     player_file = data_path.joinpath('players.pickle')
     game_file = data_path.joinpath('game.pickle')
+    database_file = data_path.joinpath('invictus.db')
 
     # Data directory loading
     if not os.path.exists(data_path):
         os.mkdir(data_path)
 
-    # Prefix file loading
-    if not os.path.exists(prefix_file):
-        with open(prefix_file, 'w') as f:
-            json.dump({}, f)
-            prefixes: {int, str} = {}
+    # Config loading, the environment overrides the config file so secrets can stay out of it
+    config = configparser.ConfigParser()
+    config['Server'] = {
+        'token': '',
+        'admins': ''
+    }
+    if os.path.exists(config_file):
+        config.read(config_file)
     else:
+        with open(config_file, 'w') as f:
+            config.write(f)
+    token = os.environ.get('INVICTUS_TOKEN') or config['Server']['token']
+    starter_admins = os.environ.get('INVICTUS_ADMINS') or config['Server']['admins']
+    if not token:
+        print(f'{Color.RED}No bot token, set INVICTUS_TOKEN or token in {config_file}.{Color.END}')
+        return
+
+    prefixes: {int, str} = {}
+    admins: [int] = []
+    loaded: {str} = set()  # which of 'files', 'players' and 'games' have finished loading, so only those are saved
+
+    def load_prefixes() -> {int, str}:
+        if not os.path.exists(prefix_file):
+            atomic_write(prefix_file, b'{}')
+            return {}
         with open(prefix_file, 'r') as f:
-            temp: {} = json.load(f)
-            prefixes = {int(k): v for k, v in temp.items()}
-
-    # Admin id file loading:
-    if not os.path.exists(admin_file):
-        with open(admin_file, 'w') as f:
-            temp = [int(i) for i in input('Please give the starter admin(s)\'(s) '
-                                          'userID(s) separated by a comma and a space.').split(', ')]
-            json.dump(temp, f)
-            admins = temp
-    else:
+            return {int(k): v for k, v in json.load(f).items()}
+
+    def load_admins() -> [int]:
+        if not os.path.exists(admin_file):  # starter admins from the config, comma separated user ids
+            temp = [int(i) for i in starter_admins.replace(',', ' ').split()]
+            atomic_write(admin_file, json.dumps(temp, indent=4).encode())
+            return temp
         with open(admin_file, 'r') as f:
-            temp: [] = json.load(f)
-            admins = [int(i) for i in temp]
-
-    # Player file loading
-    if not os.path.exists(player_file):
-        with open(player_file, 'wb') as f:
-            pickle.dump({}, f)
-            players: {int, Player} = {}
-    else:
-        with open(player_file, 'rb') as f:
-            players: {int, Player} = pickle.load(f)
-
-    # Active Game file loading
-    if not os.path.exists(game_file):
-        with open(game_file, 'wb') as f:
-            pickle.dump({}, f)
-            active_games: {int, Game} = {}
-    else:
-        with open(game_file, 'rb') as f:
-            active_games: {int, Game} = pickle.load(f)
+            return [int(i) for i in json.load(f)]
+
+    # Players are read on demand and changed players are saved with save_player(player). None until loaded.
+    players: Repository = None
+    rankings = Leaderboard()
+
+    def load_players() -> (Repository, Leaderboard):
+        repository = Repository(database_file, 'players', 'uid', ('score',))
+        if os.path.exists(player_file):  # one time migration from the pickled players file
+            legacy: {int, Player} = Journal(player_file, 'uid').load()
+            repository.bulk_upsert(legacy.values())
+            repository.flush()
+            legacy.close()
+            os.replace(player_file, f'{player_file}.migrated')
+            if os.path.exists(player_file.with_suffix('.journal')):
+                os.replace(player_file.with_suffix('.journal'), f'{player_file.with_suffix(".journal")}.migrated')
+            del legacy
+        # Leaderboard loading, only ids and scores are read so this stays small
+        board = Leaderboard()
+        for uid, score in repository.query('SELECT uid, score FROM players'):
+            board.update(uid, score)
+        if os.path.exists(member_file):  # guild memberships, {gid: [uid]}
+            with open(member_file, 'r') as f:
+                for gid, uids in json.load(f).items():
+                    for uid in uids:
+                        board.join(int(gid), uid)
+        board.dirty = False
+        return repository, board
+
+    def save_player(player: Player):
+        """
+        Queues a new or changed player to be saved and moves them to their score on every leaderboard.
+        """
+        players.upsert(player)
+        rankings.update(player.uid, player.score)
+
+    # Active games, changed games are journaled and call game_journal.mark_dirty(gid). Empty until loaded.
+    game_journal = Journal(game_file, 'gid')
+    active_games: {int, Game} = game_journal.records
+
+    # Game engine, steps active games in worker processes and journals the games they change
+    engine = GameEngine(active_games, lambda gid, diff: game_journal.mark_dirty(gid), rate=game_tick_rate)
+
+    matchmaker = Matchmaker(challenge_ttl)
+    next_gid = 1
+
+    scheduler = CommandScheduler(max_heavy_commands, user_command_rate, user_command_period)
 
     # Adding auto save
     async def auto_save(duration: int):
         while True:
             await asyncio.sleep(duration)
-            save()
+            try:
+                await save()
+            except Exception as e:  # whatever didn't save is still dirty, try again next time
+                print(f'{Color.RED}Auto save failed: {e!r}{Color.END}')
 
-    asyncio.run_coroutine_threadsafe(auto_save(auto_save_duration), asyncio.get_event_loop())
-    client.start(input('Bot API Token: '))
+    # Adding matchmaking, expires challenges and starts the games of accepted ones in batches
+    async def run_matchmaking(interval: float):
+        nonlocal next_gid
+        while True:
+            await asyncio.sleep(interval)
+            matchmaker.expire()
+            accepted = matchmaker.take_accepted()
+            if not accepted:
+                continue
+            games = []
+            for match in accepted:
+                games.append(Game(next_gid, [match.challenger, match.target]))
+                next_gid += 1
+            active_games.update((game.gid, game) for game in games)
+            for game in games:
+                game_journal.mark_dirty(game.gid)
+                engine.add(game)
+            for match, game in zip(accepted, games):
+                if match.channel:
+                    await match.channel.send(f'Game #{game.gid} started: <@{match.challenger}> vs <@{match.target}>!')
+
+    async def main():
+        """
+        Loads the small files, connects to Discord, then warms the player and game stores in the background.
+        Commands that don't need the stores are served while they load.
+        """
+        nonlocal players, rankings, next_gid
+        loop = asyncio.get_running_loop()
+        loaded_prefixes, loaded_admins = await asyncio.gather(loop.run_in_executor(None, load_prefixes),
+                                                              loop.run_in_executor(None, load_admins))
+        prefixes.update(loaded_prefixes)
+        admins.extend(loaded_admins)
+        loaded.add('files')
+        connection = asyncio.ensure_future(client.start(token))
+
+        (players, board), _ = await asyncio.gather(loop.run_in_executor(None, load_players),
+                                                   loop.run_in_executor(None, game_journal.load))
+        board.join_all(rankings)  # guild joins seen while the players loaded
+        rankings = board
+        loaded.update(('players', 'games'))
+        next_gid = max(active_games, default=0) + 1
+        engine.start(loop)
+        tasks = [asyncio.ensure_future(auto_save(auto_save_duration)),
+                 asyncio.ensure_future(run_matchmaking(matchmaking_interval))]
+        print(f'DungeonController {__version__} stores loaded.')
+        try:
+            await connection
+        finally:
+            for task in tasks:
+                task.cancel()
 
     def get_prefix(gid: discord.Guild.id):
         """
@@ -127,41 +230,57 @@ def start():
             return default_prefix
 
     @save_action
-    def save_prefixes():
+    async def save_prefixes():
         """
         Saves current dict of prefixes to a file using JSON.
         """
-        with open(prefix_file, 'w') as f:
-            f.truncate(0)
-            json.dump(prefixes, f, indent=4)
+        if 'files' not in loaded:
+            return
+        data = json.dumps(prefixes, indent=4).encode()
+        await asyncio.get_running_loop().run_in_executor(None, atomic_write, prefix_file, data)
 
     @save_action
-    def save_admins():
+    async def save_admins():
         """
-        Saves current dict of prefixes to a file using JSON.
+        Saves current list of admins to a file using JSON.
         """
-        with open(admin_file, 'w') as f:
-            f.truncate(0)
-            json.dump(admins, f, indent=4)
+        if 'files' not in loaded:
+            return
+        data = json.dumps(admins, indent=4).encode()
+        await asyncio.get_running_loop().run_in_executor(None, atomic_write, admin_file, data)
 
     @save_action
-    def save_players():
+    async def save_players():
         """
-        Saves current dict of players to a file using pickle.
+        Waits for queued player writes to reach the database.
         """
-        with open(player_file, 'wb') as f:
-            f.truncate(0)
-            pickle.dump(players, f)
+        if players is not None:
+            await asyncio.get_running_loop().run_in_executor(None, players.flush)
+
+    @save_action
+    async def save_members():
+        """
+        Saves the players of every guild using JSON, so guild leaderboards survive a restart.
+        """
+        if players is None or not rankings.dirty:
+            return
+        data = json.dumps(rankings.memberships()).encode()
+        rankings.dirty = False
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, atomic_write, member_file, data)
+        except Exception:
+            rankings.dirty = True
+            raise
 
     @save_action
-    def save_game():
+    async def save_game():
         """
-        Saves current state of all levels to a file using pickle.
+        Journals the games that changed since the last save.
         """
-        with open(game_file, 'wb') as f:
-            f.truncate(0)
-            pickle.dump(active_games, f)
+        if 'games' in loaded:
+            await game_journal.flush()
 
+    @client.event
     async def on_ready():
         """
         Called when bot is setup and ready.
@@ -169,6 +288,7 @@ def start():
         """
         print(f'DungeonController {__version__} ready.')
 
+    @client.event
     async def on_guild_join(guild: discord.Guild):
         """
         This is called when the bot is invited to and joins a new "server".
@@ -176,13 +296,16 @@ def start():
         """
         prefixes[guild.id] = default_prefix
 
-    async def on_guild_leave(guild: discord.Guild):
+    @client.event
+    async def on_guild_remove(guild: discord.Guild):
         """
         This is called when a bot leaves a "server".
         :param guild: Guild Class joined found at https://discordpy.readthedocs.io/en/latest/api.html#guild.
         """
-        del prefixes[guild.id]
+        prefixes.pop(guild.id, None)
+        rankings.remove_guild(guild.id)
 
+    @client.event
     async def on_message(message: discord.Message):
         """
         Called when a message is sent in a channel available to the bot.
@@ -192,59 +315,46 @@ def start():
         if not client.is_ready() or not message.content or message.author.bot:
             return
 
-        prefix = get_prefix(message.guild.id)
-        if len(str(message.content)) >= len(prefix) and prefix == str(message.content)[:len(prefix)]:
-            cmd = str(message.content).strip(prefix).split()[0].lower()
-            try:
-                await commands[cmd](message=message)
-            except KeyError:
-                print('User tried nonexistent command')
-
-    @command(['help', 'h'])
-    async def help_command(message: discord.Message):
-        """
-        [*, moves, tiles] Provides descriptions of commands.
-        """
-        is_admin = message.author.id in admins
-        processed_message = str(message.content).split()
-        del processed_message[0]
-        if len(processed_message) == 0:
-            active_descs = {}
-            embed_vars = [discord.Embed(title='Help Commands', color=0xc0365e)]
-            char_count = len(embed_vars[0].title)
-            for key in commands:
-                if not commands[key].hidden or is_admin:
-                    aliases = []
-                    for k in commands:
-                        aliases.append(k) if commands[key] == commands[k] else aliases
-                    if str(aliases) not in active_descs:
-                        active_descs[str(aliases)] = commands[key].__doc__
-                        char_count += len(str(aliases)) + len(str(commands[key].__doc__).replace('\n', ''))
-                        if char_count >= 6000:
-                            embed_vars.append(discord.Embed(title=f'Help Commands {len(embed_vars) + 1}',
-                                                            color=0xc0365e))
-                        embed_vars[-1].add_field(name=str(aliases), value=str(commands[key].__doc__).replace('\n', ''),
-                                            inline=False)
-            for embed_var in embed_vars:
+        parsed = router.parse(str(message.content), get_prefix(message.guild.id))
+        if parsed:
+            handler, _, args = parsed
+            if not rankings.is_member(message.guild.id, message.author.id):
+                rankings.join(message.guild.id, message.author.id)
+            submitted = await scheduler.submit(message.guild.id, message.author.id, handler, message=message, args=args)
+            if not submitted and scheduler.should_warn(message.author.id):
+                await message.channel.send(f'<@{message.author.id}>, slow down! Too many commands right now, '
+                                           'try again in a few seconds.')
+
+    @command(['help', 'h'], heavy=True)
+    async def help_command(message: discord.Message, args: str = ''):
+        """
+        [command] Provides descriptions of commands.
+        """
+        if not args:
+            for embed_var in router.help_pages(message.author.id in admins):
                 await message.channel.send(embed=embed_var)
+            return
+        name = args.split()[0]
+        embed_var = router.command_help(name)
+        if embed_var is None or (router.table[name.lower()].hidden and message.author.id not in admins):
+            await message.channel.send(f'No command called \'{name}\'.')
         else:
-            pass #other cases
+            await message.channel.send(embed=embed_var)
 
     @command()
-    async def ping(message: discord.Message):
+    async def ping(message: discord.Message, args: str = ''):
         """
         PONG! Sends the bot's latency.
         """
         await message.channel.send(f'{client.latency * 1000}ms')
 
     @command(['changeprefix', 'cp'])
-    async def change_prefix(message: discord.Message):
+    async def change_prefix(message: discord.Message, args: str = ''):
         """
         [prefix] Usable by admins to change the bot's server prefix.
         """
         if message.author.guild_permissions.administrator:
-            processed_message = str(message.content).split()
-            del processed_message[0]
+            processed_message = args.split()
             if len(processed_message) == 0:
                 await message.channel.send('No prefix argument provided.')
                 return
@@ -255,55 +365,114 @@ def start():
         else:
             await message.channel.send('Only administrators may do this.')
 
+    async def warming_up(message: discord.Message) -> bool:
+        """
+        Tells the user to retry if the player stores are still loading after a restart.
+        :return: whether they are still loading.
+        """
+        if players is None:
+            await message.channel.send('Still starting up, try again in a moment.')
+            return True
+        return False
+
     @command(['profile'])
-    async def player_profile(message: discord.Message):
+    async def player_profile(message: discord.Message, args: str = ''):
         """
         [@mention/name] views a given player's profile.
         """
-        pass
+        if await warming_up(message):
+            return
+        user = message.mentions[0] if message.mentions else message.author
+        player = players.get(user.id)
+        if not player:
+            await message.channel.send(f'<@{user.id}> has no profile yet.')
+            return
+        embed_var = discord.Embed(title=player.name or user.display_name, color=0xc0365e)
+        embed_var.add_field(name='Score', value=str(player.score))
+        embed_var.add_field(name='World Rank', value=f'#{rankings.rank(user.id)}')
+        guild_rank = rankings.rank(user.id, message.guild.id)
+        if guild_rank:
+            embed_var.add_field(name='Server Rank', value=f'#{guild_rank}')
+        await message.channel.send(embed=embed_var)
 
     @command(['top'])
-    async def leaderboard(message: discord.Message):
+    async def leaderboard(message: discord.Message, args: str = ''):
         """
-        Displays the top 10 players worldwide.
+        [server] [page] Displays the top 10 players worldwide, or in this server.
         """
-        pass
+        if await warming_up(message):
+            return
+        gid = None
+        page = 1
+        for arg in args.split():
+            if arg.lower() in ('server', 'guild'):
+                gid = message.guild.id
+            elif arg.isdigit() and int(arg) > 0:
+                page = int(arg)
+        entries = rankings.top(10, page, gid)
+        title = 'Server Leaderboard' if gid else 'World Leaderboard'
+        embed_var = discord.Embed(title=f'{title} (page {page})', color=0xc0365e)
+        if not entries:
+            embed_var.description = 'Nobody here yet.'
+        for rank, uid, score in entries:
+            embed_var.add_field(name=f'#{rank}', value=f'<@{uid}> {score}', inline=False)
+        await message.channel.send(embed=embed_var)
 
     @command(['c'])
-    async def challenge(message: discord.Message):
+    async def challenge(message: discord.Message, args: str = ''):
         """
-        [@mention/name] Initiates a challenge against another player.
+        [@mention] Initiates a challenge against another player.
         """
-        pass
+        target = message.mentions[0] if message.mentions else None
+        if target is None or target.bot or target.id == message.author.id:
+            await message.channel.send('Mention the player you want to challenge.')
+            return
+        matchmaker.challenge(message.author.id, target.id, message.channel)
+        await message.channel.send(f'<@{target.id}>, <@{message.author.id}> challenges you! Accept with '
+                                   f'{get_prefix(message.guild.id)}accept within {challenge_ttl} seconds.')
 
     @command(['a'])
-    async def accept(message: discord.Message):
+    async def accept(message: discord.Message, args: str = ''):
         """
-        [@mention/name] Accepts an existing challenge from another user.
+        [@mention] Accepts an existing challenge from another user, or the oldest one if nobody is mentioned.
         """
-        pass
+        challenger = message.mentions[0].id if message.mentions else None
+        match = matchmaker.accept(message.author.id, challenger)
+        if match is None:
+            await message.channel.send('No open challenge to accept.')
+        else:
+            await message.channel.send(f'<@{match.target}> accepted <@{match.challenger}>\'s challenge!')
 
     @command(['changename', 'name'])
-    async def change_name(message: discord.Message):
+    async def change_name(message: discord.Message, args: str = ''):
         """
         [name] Changes the name of the user who sends the message,
         as well as all of the user's custom emoji.
         """
-        pass
+        if await warming_up(message):
+            return
+        name = ' '.join(args.split())
+        if not name:
+            await message.channel.send('Give the name you want.')
+            return
+        player = players.get(message.author.id) or Player(message.author.id)
+        player.name = name[:32]
+        save_player(player)
+        await message.channel.send(f'<@{message.author.id}> is now {player.name}.')
 
-    @command(['save'], True)
-    async def save_command(message: discord.Message = None):
+    @command(['save'], True, True)
+    async def save_command(message: discord.Message = None, args: str = ''):
         """
         Called by a bot admin to save all files in the bot.
         """
         if message.author.id in admins:
-            save()
+            await save()
             await message.channel.send('Save Successful.')
         else:
             await message.channel.send('Insufficient user permissions.')
 
     @command(['exit', 'stop'], True)
-    async def exit_command(self, message: discord.Message):
+    async def exit_command(message: discord.Message, args: str = ''):
         """
         Called by a bot admin to exit the bot.
         """
@@ -314,7 +483,7 @@ def start():
             await message.channel.send('Insufficient user permissions')
 
     @command(['op'], True)
-    async def promote(message: discord.Message):
+    async def promote(message: discord.Message, args: str = ''):
         """
         [@mention] Called by a bot admin to promote a new bot admin.
         """
@@ -332,7 +501,7 @@ def start():
             await message.channel.send('Insufficient user permissions.')
 
     @command(['deop'], True)
-    async def demote(self, message: discord.Message):
+    async def demote(message: discord.Message, args: str = ''):
         """
         [@mention] Called by a bot admin to promote a new bot admin.
         """
@@ -346,18 +515,29 @@ def start():
         else:
             await message.channel.send('Insufficient user permissions.')
 
-    def save():
+    async def save():
         """
         Goes through and calls save actions of the bot.
         """
         for fun in save_actions:
-            fun()
-        return
+            await fun()
 
     async def close():
-        save()
+        await scheduler.close()
+        await asyncio.get_running_loop().run_in_executor(None, engine.stop)
+        await save()
+        if players is not None:
+            await asyncio.get_running_loop().run_in_executor(None, players.close)
+        if 'games' in loaded:
+            await game_journal.close()
         await client.close()
 
+    # discord.py's Client is bound to this thread's event loop, so run on it rather than a new one.
+    try:
+        client.loop.run_until_complete(main())
+    except KeyboardInterrupt:
+        client.loop.run_until_complete(close())
+
 
 if __name__ == '__main__':
     start()
\ No newline at end of file
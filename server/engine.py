@@ -0,0 +1,179 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing.connection import Connection
+
+from server.storage import Game
+
+_ADD = 0
+_REMOVE = 1
+_STOP = 2
+_MISSING = object()
+
+
+def _step_games(games: {int: Game}, dt: float) -> {int: {str: object}}:
+    """
+    Steps every game once and gives the attributes each one assigned new values to.
+    """
+    diffs = {}
+    for gid, game in games.items():
+        before = dict(vars(game))
+        game.step(dt)
+        diff = {name: value for name, value in vars(game).items() if before.get(name, _MISSING) is not value}
+        if diff:
+            diffs[gid] = diff
+    return diffs
+
+
+def _worker(conn: Connection, rate: float, max_steps: int):
+    """
+    Main loop of one engine process. Owns a shard of the games and ticks them at a fixed rate, taking commands from
+    the controller between ticks and sending back one (tick, diffs) message per tick that changed anything.
+    """
+    games: {int: Game} = {}
+    step = 1 / rate
+    tick = 0
+    next_tick = time.perf_counter() + step
+    while True:
+        timeout = next_tick - time.perf_counter()
+        while conn.poll(max(0.0, timeout)):
+            op, value = conn.recv()
+            if op == _ADD:
+                games[value.gid] = value
+            elif op == _REMOVE:
+                games.pop(value, None)
+            else:
+                conn.close()
+                return
+            timeout = next_tick - time.perf_counter()
+            if timeout <= 0:
+                break
+        steps = 0
+        while next_tick <= time.perf_counter():
+            if steps == max_steps:  # too far behind to catch up, drop the time instead
+                next_tick = time.perf_counter() + step
+                break
+            tick += 1
+            diffs = _step_games(games, step)
+            if diffs:
+                conn.send((tick, diffs))
+            next_tick += step
+            steps += 1
+
+
+class GameEngine(object):
+    """
+    Runs active games server-side, sharded across worker processes so throughput grows with the number of cores.
+    Each worker steps its games at a fixed rate. Changes are streamed back as diffs of the attributes Game.step assigned
+    and applied to the controller's copies, so active_games stays current for commands and saving without the
+    simulation ever running on the event loop.
+    """
+
+    def __init__(self, games: {int: Game}, on_diff: callable = None, workers: int = None, rate: float = 20,
+                 max_steps: int = 5):
+        """
+        :param games: the controller's active games, kept up to date with the workers' copies.
+        :param on_diff: called on the event loop with (gid, diff) after a diff is applied to a game.
+        :param workers: number of worker processes, one per core if not given.
+        :param rate: game ticks per second.
+        :param max_steps: most ticks a worker runs back to back to catch up after falling behind.
+        """
+        self.games = games
+        self.on_diff = on_diff
+        self.workers = workers or os.cpu_count() or 1
+        self.rate = rate
+        self.max_steps = max_steps
+        self.tick = 0  # latest tick heard from any worker
+        self._loop: asyncio.AbstractEventLoop = None
+        self._processes: [multiprocessing.Process] = []
+        self._conns: [Connection] = []
+        self._send_locks: [threading.Lock] = []
+        self._readers: [threading.Thread] = []
+        self._shard_of: {int: int} = {}
+        self._load: [int] = []
+
+    def start(self, loop: asyncio.AbstractEventLoop = None):
+        """
+        Starts the worker processes and hands them every game in games.
+        :param loop: the event loop diffs are applied on, the current one if not given.
+        """
+        self._loop = loop or asyncio.get_event_loop()
+        context = multiprocessing.get_context('spawn')
+        for i in range(self.workers):
+            conn, child = context.Pipe()
+            process = context.Process(target=_worker, args=(child, self.rate, self.max_steps),
+                                      name=f'GameEngine-{i}', daemon=True)
+            process.start()
+            child.close()
+            reader = threading.Thread(target=self._read, args=(conn,), name=f'GameEngine-reader-{i}', daemon=True)
+            reader.start()
+            self._processes.append(process)
+            self._conns.append(conn)
+            self._send_locks.append(threading.Lock())
+            self._readers.append(reader)
+            self._load.append(0)
+        for game in self.games.values():
+            self.add(game)
+
+    def add(self, game: Game):
+        """
+        Starts running a game on the least loaded worker. It should already be in games.
+        """
+        if game.gid in self._shard_of:
+            self.remove(game.gid)
+        shard = min(range(len(self._load)), key=self._load.__getitem__)
+        self._shard_of[game.gid] = shard
+        self._load[shard] += 1
+        self._send(shard, (_ADD, game))
+
+    def remove(self, gid: int):
+        """
+        Stops running a game. Diffs for it still in flight are ignored.
+        """
+        shard = self._shard_of.pop(gid, None)
+        if shard is not None:
+            self._load[shard] -= 1
+            self._send(shard, (_REMOVE, gid))
+
+    def stop(self):
+        """
+        Stops the workers and waits for them to exit. Blocking.
+        """
+        for shard in range(len(self._conns)):
+            try:
+                self._send(shard, (_STOP, None))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join()
+        for reader in self._readers:
+            reader.join()
+        for conn in self._conns:
+            conn.close()
+        self._processes, self._conns, self._send_locks, self._readers, self._load = [], [], [], [], []
+        self._shard_of.clear()
+
+    def _send(self, shard: int, message: tuple):
+        with self._send_locks[shard]:
+            self._conns[shard].send(message)
+
+    def _read(self, conn: Connection):
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            self._loop.call_soon_threadsafe(self._apply, *message)
+
+    def _apply(self, tick: int, diffs: {int: {str: object}}):
+        self.tick = max(self.tick, tick)
+        for gid, diff in diffs.items():
+            game = self.games.get(gid)
+            if game is None or gid not in self._shard_of:
+                continue
+            for name, value in diff.items():
+                setattr(game, name, value)
+            if self.on_diff:
+                self.on_diff(gid, diff)
@@ -0,0 +1,237 @@
+import random
+
+
+class _Node(object):
+    __slots__ = ('key', 'score', 'next', 'span')
+
+    def __init__(self, key, score, level: int):
+        self.key = key
+        self.score = score
+        self.next: [_Node] = [None] * level
+        self.span: [int] = [0] * level  # number of rank positions each link jumps over
+
+
+class RankedSkipList(object):
+    """
+    An indexable skip list of (key, score) ordered by score, highest first, ties broken by key.
+    Updates, rank lookups and finding a rank are O(log n); reading K entries from a rank is O(log n + K).
+    """
+
+    MAX_LEVEL = 32
+
+    def __init__(self):
+        self._head = _Node(None, None, RankedSkipList.MAX_LEVEL)
+        self._level = 1
+        self._scores = {}
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __contains__(self, key):
+        return key in self._scores
+
+    def score(self, key):
+        return self._scores.get(key)
+
+    def update(self, key, score):
+        """
+        Adds a key or moves it to a new score.
+        """
+        old = self._scores.get(key)
+        if old is not None:
+            if old == score:
+                return
+            self._delete(key, old)
+        self._insert(key, score)
+        self._scores[key] = score
+
+    def remove(self, key):
+        score = self._scores.pop(key, None)
+        if score is not None:
+            self._delete(key, score)
+
+    def rank(self, key) -> int:
+        """
+        Gives a key's 1-based rank, or None if it isn't on the board.
+        """
+        score = self._scores.get(key)
+        if score is None:
+            return None
+        rank = 0
+        x = self._head
+        for i in reversed(range(self._level)):
+            while x.next[i] and (self._precedes(x.next[i], key, score) or x.next[i].key == key):
+                rank += x.span[i]
+                x = x.next[i]
+            if x.key == key:
+                return rank
+        return None
+
+    def range(self, start: int, count: int) -> [(object, object)]:
+        """
+        Gives up to count (key, score) pairs starting at the 1-based rank start.
+        """
+        results = []
+        if start < 1 or start > len(self._scores):
+            return results
+        traversed = 0
+        x = self._head
+        for i in reversed(range(self._level)):
+            while x.next[i] and traversed + x.span[i] <= start:
+                traversed += x.span[i]
+                x = x.next[i]
+            if traversed == start:
+                break
+        while x and len(results) < count:
+            results.append((x.key, x.score))
+            x = x.next[0]
+        return results
+
+    @staticmethod
+    def _precedes(node: _Node, key, score) -> bool:
+        return node.score > score or (node.score == score and node.key < key)
+
+    @staticmethod
+    def _random_level() -> int:
+        level = 1
+        while level < RankedSkipList.MAX_LEVEL and random.random() < 0.25:
+            level += 1
+        return level
+
+    def _insert(self, key, score):
+        update = [None] * RankedSkipList.MAX_LEVEL
+        rank = [0] * RankedSkipList.MAX_LEVEL
+        x = self._head
+        for i in reversed(range(self._level)):
+            rank[i] = 0 if i == self._level - 1 else rank[i + 1]
+            while x.next[i] and self._precedes(x.next[i], key, score):
+                rank[i] += x.span[i]
+                x = x.next[i]
+            update[i] = x
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                rank[i] = 0
+                update[i] = self._head
+                self._head.span[i] = len(self._scores)
+            self._level = level
+        node = _Node(key, score, level)
+        for i in range(level):
+            node.next[i] = update[i].next[i]
+            update[i].next[i] = node
+            node.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self._level):
+            update[i].span[i] += 1
+
+    def _delete(self, key, score):
+        update = [None] * RankedSkipList.MAX_LEVEL
+        x = self._head
+        for i in reversed(range(self._level)):
+            while x.next[i] and self._precedes(x.next[i], key, score):
+                x = x.next[i]
+            update[i] = x
+        x = x.next[0]
+        if x is None or x.key != key:
+            return
+        for i in range(self._level):
+            if update[i].next[i] is x:
+                update[i].span[i] += x.span[i] - 1
+                update[i].next[i] = x.next[i]
+            else:
+                update[i].span[i] -= 1
+        while self._level > 1 and self._head.next[self._level - 1] is None:
+            self._level -= 1
+
+
+class Leaderboard(object):
+    """
+    A global board plus one board per guild, kept up to date incrementally as scores change.
+    """
+
+    def __init__(self):
+        self.board = RankedSkipList()
+        self.guild_boards: {int: RankedSkipList} = {}
+        self._guilds_of: {int: {int}} = {}
+        self._members: {int: {int}} = {}  # every player who joined a guild, scored or not
+        self.dirty = False  # whether guild memberships changed since they were last saved
+
+    def update(self, uid: int, score: int):
+        """
+        Sets a player's score on the global board and every guild board they are on.
+        """
+        self.board.update(uid, score)
+        for gid in self._guilds_of.get(uid, ()):
+            board = self.guild_boards.get(gid)
+            if board is not None:
+                board.update(uid, score)
+
+    def remove(self, uid: int):
+        self.board.remove(uid)
+        for gid in self._guilds_of.pop(uid, ()):
+            self._members[gid].discard(uid)
+            self.guild_boards[gid].remove(uid)
+            self.dirty = True
+
+    def join(self, gid: int, uid: int):
+        """
+        Puts a player on a guild's board, at their global score.
+        """
+        guilds = self._guilds_of.setdefault(uid, set())
+        if gid in guilds:
+            return
+        guilds.add(gid)
+        self._members.setdefault(gid, set()).add(uid)
+        self.dirty = True
+        board = self.guild_boards.get(gid)
+        if board is None:
+            board = self.guild_boards[gid] = RankedSkipList()
+        score = self.board.score(uid)
+        if score is not None:
+            board.update(uid, score)
+
+    def is_member(self, gid: int, uid: int) -> bool:
+        return gid in self._guilds_of.get(uid, ())
+
+    def memberships(self) -> {int: [int]}:
+        """
+        Gives the players in every guild, for saving.
+        """
+        return {gid: sorted(members) for gid, members in self._members.items() if members}
+
+    def join_all(self, other):
+        """
+        Copies every guild membership of another Leaderboard, such as one that took joins while this one loaded.
+        """
+        for gid, members in other._members.items():
+            for uid in members:
+                self.join(gid, uid)
+
+    def leave(self, gid: int, uid: int):
+        guilds = self._guilds_of.get(uid)
+        if guilds and gid in guilds:
+            guilds.discard(gid)
+            self._members[gid].discard(uid)
+            self.dirty = True
+            board = self.guild_boards.get(gid)
+            if board is not None:
+                board.remove(uid)
+
+    def remove_guild(self, gid: int):
+        self.guild_boards.pop(gid, None)
+        for uid in self._members.pop(gid, ()):
+            self._guilds_of[uid].discard(gid)
+            self.dirty = True
+
+    def top(self, count: int = 10, page: int = 1, gid: int = None) -> [(int, int, int)]:
+        """
+        Gives a page of a board as (rank, uid, score).
+        :param gid: the guild whose board to read, the global board if not given.
+        """
+        board = self.board if gid is None else self.guild_boards.get(gid, RankedSkipList())
+        start = (page - 1) * count + 1
+        return [(start + i, uid, score) for i, (uid, score) in enumerate(board.range(start, count))]
+
+    def rank(self, uid: int, gid: int = None) -> int:
+        board = self.board if gid is None else self.guild_boards.get(gid)
+        return board.rank(uid) if board else None
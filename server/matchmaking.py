@@ -0,0 +1,168 @@
+import math
+import time
+
+
+class TimerWheel(object):
+    """
+    Expires keys after a delay without a timer or task per key.
+    Keys hash into a ring of slots by the tick they are due in. Advancing the wheel only looks at the slots for the
+    ticks that passed, so scheduling, cancelling and expiring are all O(1) per key.
+    """
+
+    def __init__(self, resolution: float = 1.0, slots: int = 128, now: float = None):
+        """
+        :param resolution: seconds per tick, keys expire up to this late.
+        :param slots: size of the ring. Delays longer than slots * resolution still work, their keys are just looked at
+        once per trip around the ring.
+        """
+        self.resolution = resolution
+        self._origin = time.monotonic() if now is None else now
+        self._current = 0
+        self._slots: [{object: int}] = [{} for _ in range(slots)]
+        self._due: {object: int} = {}
+
+    def __len__(self):
+        return len(self._due)
+
+    def __contains__(self, key):
+        return key in self._due
+
+    def schedule(self, key, delay: float, now: float = None):
+        """
+        Sets a key to expire delay seconds from now, replacing any earlier schedule for it.
+        """
+        self.cancel(key)
+        now = time.monotonic() if now is None else now
+        tick = max(self._current + 1, math.ceil((now + delay - self._origin) / self.resolution))
+        self._slots[tick % len(self._slots)][key] = tick
+        self._due[key] = tick
+
+    def cancel(self, key):
+        tick = self._due.pop(key, None)
+        if tick is not None:
+            del self._slots[tick % len(self._slots)][key]
+
+    def advance(self, now: float = None) -> list:
+        """
+        Moves the wheel up to now.
+        :return: the keys that expired, in the order they were due.
+        """
+        now = time.monotonic() if now is None else now
+        target = math.floor((now - self._origin) / self.resolution)
+        expired = []
+        if target - self._current > len(self._slots):  # a long gap, one pass over the ring covers it
+            due = [(tick, key) for bucket in self._slots for key, tick in bucket.items() if tick <= target]
+            due.sort(key=lambda entry: entry[0])
+            expired = [key for _, key in due]
+            self._current = target
+        while self._current < target:
+            self._current += 1
+            bucket = self._slots[self._current % len(self._slots)]
+            expired.extend(key for key, tick in bucket.items() if tick <= self._current)
+        for key in expired:
+            del self._slots[self._due.pop(key) % len(self._slots)][key]
+        return expired
+
+
+class Challenge(object):
+    __slots__ = ('challenger', 'target', 'channel', 'created')
+
+    def __init__(self, challenger: int, target: int, channel=None, created: float = None):
+        """
+        :param challenger: user id of the player who challenged.
+        :param target: user id of the player challenged.
+        :param channel: where the challenge was made, to announce the game in.
+        """
+        self.challenger = challenger
+        self.target = target
+        self.channel = channel
+        self.created = time.monotonic() if created is None else created
+
+
+class Matchmaker(object):
+    """
+    Pending challenges indexed both by who made them and by who they are for, so accepting is O(1) however many are
+    pending. Challenges expire through a TimerWheel. Accepted ones are queued so the controller can start their games
+    in batches.
+    """
+
+    def __init__(self, ttl: float = 120, resolution: float = 1.0):
+        """
+        :param ttl: seconds a challenge stays open.
+        :param resolution: how often, in seconds, expiry is checked.
+        """
+        self.ttl = ttl
+        self.wheel = TimerWheel(resolution, max(1, math.ceil(ttl / resolution)) + 1)
+        self.by_challenger: {int: {int: Challenge}} = {}
+        self.by_target: {int: {int: Challenge}} = {}
+        self.accepted: [Challenge] = []
+
+    def __len__(self):
+        return len(self.wheel)
+
+    def challenge(self, challenger: int, target: int, channel=None, now: float = None) -> Challenge:
+        """
+        Opens a challenge, or renews the one already open between the two players.
+        """
+        pending = self.by_challenger.setdefault(challenger, {}).get(target)
+        if pending is None:
+            pending = Challenge(challenger, target, channel, now)
+            self.by_challenger[challenger][target] = pending
+            self.by_target.setdefault(target, {})[challenger] = pending
+        else:
+            pending.channel = channel or pending.channel
+        self.wheel.schedule((challenger, target), self.ttl, now)
+        return pending
+
+    def pending_for(self, target: int) -> [Challenge]:
+        """
+        Gives the challenges open against a player, oldest first.
+        """
+        return list(self.by_target.get(target, {}).values())
+
+    def accept(self, target: int, challenger: int = None) -> Challenge:
+        """
+        Accepts a challenge and queues it to have its game started.
+        :param challenger: whose challenge to accept, the oldest one open against target if not given.
+        :return: the accepted challenge, or None if there was no such challenge.
+        """
+        challenges = self.by_target.get(target)
+        if not challenges:
+            return None
+        if challenger is None:
+            challenger = next(iter(challenges))
+        accepted = self._remove(challenger, target)
+        if accepted:
+            self.accepted.append(accepted)
+        return accepted
+
+    def cancel(self, challenger: int, target: int) -> Challenge:
+        return self._remove(challenger, target)
+
+    def expire(self, now: float = None) -> [Challenge]:
+        """
+        Closes every challenge whose time ran out.
+        :return: the expired challenges.
+        """
+        return [self._remove(challenger, target) for challenger, target in self.wheel.advance(now)]
+
+    def take_accepted(self) -> [Challenge]:
+        """
+        Gives the challenges accepted since the last call, in the order they were accepted.
+        """
+        accepted, self.accepted = self.accepted, []
+        return accepted
+
+    def _remove(self, challenger: int, target: int) -> Challenge:
+        challenges = self.by_challenger.get(challenger)
+        pending = challenges.pop(target, None) if challenges else None
+        if pending is None:
+            return None
+        if not challenges:
+            del self.by_challenger[challenger]
+        challengers = self.by_target[target]
+        del challengers[challenger]
+        if not challengers:
+            del self.by_target[target]
+        self.wheel.cancel((challenger, target))
+        return pending
@@ -0,0 +1,323 @@
+import asyncio
+import os
+import pickle
+import struct
+import zlib
+from collections.abc import MutableMapping
+from concurrent.futures import Executor
+from pathlib import Path
+
+from server import snapshot
+
+_FRAME = struct.Struct('>II')  # payload length, crc32 of payload
+_OP = struct.Struct('>Bq')  # op, key, followed by the encoded record for puts
+_PUT = 0
+_DELETE = 1
+_PICKLE = 0x80
+
+
+def atomic_write(path: Path, data: bytes):
+    """
+    Writes a whole file so that readers see either the old contents or the new ones, never a partial write.
+    """
+    temp = Path(f'{path}.tmp')
+    with open(temp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+
+
+def _read_snapshot(path: Path) -> {int: bytes}:
+    """
+    Reads every encoded record of a snapshot into memory.
+    """
+    if not path.exists():
+        return {}
+    with snapshot.SnapshotReader(path) as reader:
+        return dict(reader.items())
+
+
+def _read_journal(path: Path, records: {object: bytes}, legacy: bool = False) -> int:
+    """
+    Replays journal frames onto records, stopping at the first torn or corrupt frame.
+    :param legacy: also replay pickled frames written by older versions, only done when migrating.
+    :return: number of bytes of valid journal.
+    """
+    if not path.exists():
+        return 0
+    valid = 0
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(_FRAME.size)
+            if len(header) < _FRAME.size:
+                break
+            length, checksum = _FRAME.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                break
+            if legacy and payload[0] == _PICKLE:
+                op, key, data = pickle.loads(payload)
+            else:
+                op, key = _OP.unpack_from(payload)
+                data = payload[_OP.size:]
+            if op == _PUT:
+                records[key] = data
+            else:
+                records.pop(key, None)
+            valid += _FRAME.size + length
+    return valid
+
+
+def _is_legacy(snapshot_path: Path, journal_path: Path) -> bool:
+    """
+    Whether a snapshot or its journal was pickled by a version from before the snapshot format.
+    """
+    if snapshot_path.exists() and not snapshot.is_snapshot(snapshot_path):
+        return True
+    if not journal_path.exists():
+        return False
+    with open(journal_path, 'rb') as f:
+        header = f.read(_FRAME.size)
+        return len(header) == _FRAME.size and f.read(1) == bytes((_PICKLE,))
+
+
+def _migrate(snapshot_path: Path, journal_path: Path, key: str = None):
+    """
+    One time conversion of a pickled snapshot and journal: every record is unpickled, given its key and re-encoded,
+    then written to a snapshot in the current format and the journal is emptied. Nothing is unpickled after this.
+    :param key: the attribute of a record that holds its key, older records didn't store it.
+    """
+    stored = {}
+    if snapshot_path.exists():
+        if snapshot.is_snapshot(snapshot_path):
+            stored = _read_snapshot(snapshot_path)
+        else:
+            with open(snapshot_path, 'rb') as f:
+                stored = pickle.load(f)  # either pickled records or the records themselves
+    _read_journal(journal_path, stored, legacy=True)
+    encoded = {}
+    for record_key, value in stored.items():
+        if isinstance(value, bytes) and not snapshot.is_legacy(value):
+            encoded[record_key] = value
+            continue
+        record = snapshot.complete(pickle.loads(value) if isinstance(value, bytes) else value)
+        if key:
+            setattr(record, key, record_key)
+        encoded[record_key] = snapshot.encode(record)
+    snapshot.write_snapshot(snapshot_path, encoded)
+    atomic_write(journal_path, b'')
+    print(f'Migrated {len(encoded)} records in {snapshot_path} to the snapshot format.')
+
+
+class Records(MutableMapping):
+    """
+    The live records of a Journal by key. Records in the snapshot are left in the memory-mapped file and decoded the
+    first time they are accessed, so loading costs as much as reading the snapshot's index and replaying the journal.
+    """
+
+    def __init__(self):
+        self._decoded: {int: object} = {}
+        self._encoded: {int: bytes} = {}  # not decoded yet, None for records still in the snapshot file
+        self._reader: snapshot.SnapshotReader = None
+
+    def reset(self, reader: snapshot.SnapshotReader, encoded: {int: bytes}):
+        """
+        Replaces every record with encoded ones.
+        :param reader: the snapshot records encoded as None are read from.
+        """
+        self._decoded = {}
+        self._encoded = encoded
+        self._reader = reader
+
+    def replace_snapshot(self, path: Path, snapshot_path: Path):
+        """
+        Moves a new snapshot file over the one records are read from and reads from it instead. It must hold every
+        record the old one did that isn't decoded yet. The old file is unmapped first, Windows can't replace it while
+        it is mapped.
+        """
+        self.close()
+        os.replace(path, snapshot_path)
+        self._reader = snapshot.SnapshotReader(snapshot_path)
+
+    def close(self):
+        """
+        Unmaps the snapshot file. Records that aren't decoded yet can't be read after this.
+        """
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def __getitem__(self, key: int):
+        record = self._decoded.get(key)
+        if record is None:
+            data = self._encoded.pop(key)
+            record = self._decoded[key] = snapshot.decode(self._reader[key] if data is None else data)
+        return record
+
+    def __setitem__(self, key: int, record):
+        self._encoded.pop(key, None)
+        self._decoded[key] = record
+
+    def __delitem__(self, key: int):
+        if self._decoded.pop(key, None) is None:
+            del self._encoded[key]
+
+    def __contains__(self, key: int):
+        return key in self._decoded or key in self._encoded
+
+    def __iter__(self):
+        # Copied, since reading a record moves it from one dict to the other.
+        return iter(list(self._decoded) + list(self._encoded))
+
+    def __len__(self):
+        return len(self._decoded) + len(self._encoded)
+
+    def clear(self):
+        self.close()
+        self.reset(None, {})
+
+
+class Journal:
+    """
+    Incremental persistence for a dict of records (players, active games, ...).
+    Changed records are marked dirty and appended to a journal file when flushed, so a save costs as much as the number
+    of records that changed. The journal is folded back into the snapshot file in the background once it grows past a
+    threshold. All file I/O runs in an executor and files are only ever replaced atomically.
+    """
+
+    def __init__(self, snapshot_path: Path, key: str = None, executor: Executor = None,
+                 compact_bytes: int = 16 * 1024 * 1024):
+        """
+        :param snapshot_path: the snapshot file, the journal is kept next to it with a .journal suffix.
+        :param key: the attribute of a record that holds its key, filled in when migrating pickled files.
+        :param executor: executor file I/O runs in, the event loop's default executor if not given.
+        :param compact_bytes: journal size in bytes after which it is compacted into the snapshot.
+        """
+        self.snapshot_path = Path(snapshot_path)
+        self.journal_path = self.snapshot_path.with_suffix('.journal')
+        self.key = key
+        self.records = Records()  # filled by load
+        self.executor = executor
+        self.compact_bytes = compact_bytes
+        self.journal_size = 0
+        self._dirty: {object} = set()
+        self._deleted: {object} = set()
+        self._lock = asyncio.Lock()
+        self._compaction: asyncio.Future = None
+
+    @property
+    def dirty(self) -> int:
+        """
+        Number of changes waiting to be flushed.
+        """
+        return len(self._dirty) + len(self._deleted)
+
+    def load(self) -> Records:
+        """
+        Opens the snapshot and replays the journal into records, which are decoded as they are accessed. Blocking,
+        meant for startup or an executor. Files pickled by an older version are converted to the snapshot format first.
+        """
+        if _is_legacy(self.snapshot_path, self.journal_path):
+            _migrate(self.snapshot_path, self.journal_path, self.key)
+        reader = snapshot.SnapshotReader(self.snapshot_path) if self.snapshot_path.exists() else None
+        stored = dict.fromkeys(reader) if reader else {}
+        self.journal_size = _read_journal(self.journal_path, stored)
+        if self.journal_path.exists() and os.path.getsize(self.journal_path) != self.journal_size:
+            # Cut off a torn tail left by a crash, so new frames aren't appended after garbage.
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(self.journal_size)
+        self.records.reset(reader, stored)
+        return self.records
+
+    def mark_dirty(self, key):
+        """
+        Records that a record was added or changed and needs to be saved.
+        """
+        self._deleted.discard(key)
+        self._dirty.add(key)
+
+    def mark_deleted(self, key):
+        """
+        Records that a record was removed and its saved copy should be dropped.
+        """
+        self._dirty.discard(key)
+        self._deleted.add(key)
+
+    async def flush(self):
+        """
+        Appends every dirty record to the journal, then starts a background compaction if the journal is too big.
+        Records are serialized on the event loop so the saved state is consistent, the write happens in the executor.
+        """
+        if not self._dirty and not self._deleted:
+            return
+        dirty, self._dirty = self._dirty, set()
+        deleted, self._deleted = self._deleted, set()
+        frames = []
+        for key in dirty:
+            if key in self.records:
+                frames.append(self._frame(_PUT, key, snapshot.encode(self.records[key])))
+        for key in deleted:
+            frames.append(self._frame(_DELETE, key, b''))
+        data = b''.join(frames)
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            try:
+                await loop.run_in_executor(self.executor, self._append, data)
+            except BaseException:
+                # Nothing was saved, so everything stays dirty for the next flush, after anything changed meanwhile.
+                for key in dirty:
+                    if key not in self._deleted:
+                        self._dirty.add(key)
+                for key in deleted:
+                    if key not in self._dirty:
+                        self._deleted.add(key)
+                raise
+        self.journal_size += len(data)
+        if self.journal_size >= self.compact_bytes and (self._compaction is None or self._compaction.done()):
+            self._compaction = asyncio.ensure_future(self.compact())
+
+    async def compact(self):
+        """
+        Folds the journal into a new snapshot in the executor and starts a fresh journal.
+        Flushes wait for the compaction to finish, changes made meanwhile stay dirty until then. The new snapshot is
+        swapped in on the event loop, so records are never read while no snapshot is mapped.
+        """
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            compacted = await loop.run_in_executor(self.executor, self._compact)
+            self.records.replace_snapshot(compacted, self.snapshot_path)
+            await loop.run_in_executor(self.executor, atomic_write, self.journal_path, b'')
+            self.journal_size = 0
+
+    async def close(self):
+        """
+        Flushes outstanding changes and waits for any running compaction.
+        """
+        await self.flush()
+        if self._compaction:
+            await self._compaction
+
+    @staticmethod
+    def _frame(op: int, key: int, data: bytes) -> bytes:
+        payload = _OP.pack(op, key) + data
+        return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def _append(self, data: bytes):
+        with open(self.journal_path, 'ab', buffering=0) as f:
+            start = f.tell()
+            try:
+                remaining = memoryview(data)
+                while remaining:
+                    remaining = remaining[f.write(remaining):]
+                os.fsync(f.fileno())
+            except BaseException:
+                os.ftruncate(f.fileno(), start)  # don't leave a torn frame for the next append to follow
+                raise
+
+    def _compact(self) -> Path:
+        stored = _read_snapshot(self.snapshot_path)
+        _read_journal(self.journal_path, stored)
+        compacted = Path(f'{self.snapshot_path}.compacted')
+        snapshot.write_snapshot(compacted, stored)
+        return compacted
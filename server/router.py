@@ -0,0 +1,103 @@
+from types import MappingProxyType
+
+import discord
+
+HELP_COLOR = 0xc0365e
+_EMBED_CHARACTERS = 6000  # Discord's limit on the text in one embed
+_EMBED_FIELDS = 25  # Discord's limit on fields in one embed
+
+
+class CommandRouter(object):
+    """
+    Resolves command names and aliases to handlers through a frozen table built when commands are registered, and
+    keeps the help embeds built from their docstrings, so nothing about commands is recomputed per message.
+    """
+
+    def __init__(self):
+        self._handlers: {str: callable} = {}
+        self._aliases: {callable: [str]} = {}
+        self.table = MappingProxyType({})
+        self._help: {bool: [discord.Embed]} = {}
+        self._command_help: {callable: discord.Embed} = {}
+
+    def __contains__(self, name: str):
+        return name in self.table
+
+    def register(self, function: callable, aliases: [str] = None, hidden: bool = False, heavy: bool = False):
+        """
+        Adds a command under its function name and any aliases.
+        :param hidden: hidden commands only show in the help given to bot admins.
+        :param heavy: heavy commands are queued by the CommandScheduler instead of run straight away.
+        """
+        function.hidden = hidden
+        function.heavy = heavy
+        names = self._aliases.setdefault(function, [])
+        for name in [function.__name__] + list(aliases or ()):
+            previous = self._handlers.get(name)
+            if previous and previous is not function:
+                self._aliases[previous].remove(name)
+            self._handlers[name] = function
+            if name not in names:
+                names.append(name)
+        self.table = MappingProxyType(dict(self._handlers))
+        self._help.clear()
+        self._command_help.clear()
+
+    def parse(self, content: str, prefix: str) -> (callable, str, str):
+        """
+        Splits a message into its command handler, the name it was called by and the rest of the message.
+        :return: (handler, name, arguments), or None if the message isn't a known command with this prefix.
+        """
+        if not content.startswith(prefix):
+            return None
+        parts = content[len(prefix):].split(None, 1)
+        if not parts:
+            return None
+        name = parts[0].lower()
+        handler = self.table.get(name)
+        if handler is None:
+            return None
+        return handler, name, parts[1] if len(parts) > 1 else ''
+
+    def help_pages(self, admin: bool) -> [discord.Embed]:
+        """
+        Gives the help embeds listing every command, split into pages that fit Discord's limits.
+        :param admin: whether to include hidden commands.
+        """
+        pages = self._help.get(admin)
+        if pages is None:
+            pages = self._help[admin] = self._build_help(admin)
+        return pages
+
+    def command_help(self, name: str) -> discord.Embed:
+        """
+        Gives the help embed for one command, or None if there is no such command.
+        """
+        handler = self.table.get(name.lower())
+        if handler is None:
+            return None
+        embed_var = self._command_help.get(handler)
+        if embed_var is None:
+            embed_var = discord.Embed(title=str(self._aliases[handler]), description=self._description(handler),
+                                      color=HELP_COLOR)
+            self._command_help[handler] = embed_var
+        return embed_var
+
+    @staticmethod
+    def _description(function: callable) -> str:
+        return ' '.join(str(function.__doc__).split())
+
+    def _build_help(self, admin: bool) -> [discord.Embed]:
+        pages = [discord.Embed(title='Help Commands', color=HELP_COLOR)]
+        char_count = len(pages[0].title)
+        for function, aliases in self._aliases.items():
+            if not aliases or (function.hidden and not admin):
+                continue
+            name = str(aliases)
+            value = self._description(function)
+            char_count += len(name) + len(value)
+            if char_count >= _EMBED_CHARACTERS or len(pages[-1].fields) >= _EMBED_FIELDS:
+                pages.append(discord.Embed(title=f'Help Commands {len(pages) + 1}', color=HELP_COLOR))
+                char_count = len(pages[-1].title) + len(name) + len(value)
+            pages[-1].add_field(name=name, value=value, inline=False)
+        return pages
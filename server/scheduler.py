@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+
+class RateLimiter(object):
+    """
+    A token bucket per user, letting each user run `rate` commands per `period` seconds with bursts of up to `rate`.
+    """
+
+    def __init__(self, rate: int, period: float):
+        self.rate = rate
+        self.period = period
+        self._buckets: {int: (float, float)} = {}  # uid: (tokens, time of last refill)
+
+    def allow(self, uid: int, now: float = None) -> bool:
+        """
+        Takes a token from a user's bucket.
+        :return: whether the user was under their limit.
+        """
+        now = time.monotonic() if now is None else now
+        tokens, last = self._buckets.get(uid, (self.rate, now))
+        tokens = min(self.rate, tokens + (now - last) * self.rate / self.period)
+        if tokens < 1:
+            self._buckets[uid] = (tokens, now)
+            return False
+        self._buckets[uid] = (tokens - 1, now)
+        if len(self._buckets) > 4096:
+            self._prune(now)
+        return True
+
+    def _prune(self, now: float):
+        # A bucket that would have refilled completely is the same as no bucket at all.
+        self._buckets = {uid: (tokens, last) for uid, (tokens, last) in self._buckets.items()
+                         if now - last < self.period}
+
+
+class CommandScheduler(object):
+    """
+    Runs command handlers so slow ones can't hold up the rest of the bot.
+    Light commands run straight away. Heavy ones go into a bounded queue per guild, drained in order by one task per
+    busy guild, with at most `concurrency` heavy commands running across all guilds.
+    """
+
+    def __init__(self, concurrency: int = 8, rate: int = 5, period: float = 10.0, queue_size: int = 32):
+        """
+        :param concurrency: most heavy commands running at once.
+        :param rate: commands a user may run per period.
+        :param period: seconds over which rate is counted.
+        :param queue_size: most heavy commands waiting per guild, more are turned away.
+        """
+        self.limiter = RateLimiter(rate, period)
+        self.queue_size = queue_size
+        self._warned: {int: float} = {}  # uid: when they were last told they were turned away
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._queues: {int: asyncio.Queue} = {}
+        self._drains: {int: asyncio.Task} = {}
+
+    def pending(self, gid: int) -> int:
+        """
+        Number of heavy commands waiting in a guild's queue.
+        """
+        queue = self._queues.get(gid)
+        return queue.qsize() if queue else 0
+
+    async def submit(self, gid: int, uid: int, handler: callable, **kwargs) -> bool:
+        """
+        Runs or queues a command handler for a user in a guild.
+        :return: False if the user is over their rate limit or the guild's queue is full, else True.
+        """
+        if not self.limiter.allow(uid):
+            return False
+        if not getattr(handler, 'heavy', False):
+            await self._run(handler, kwargs)
+            return True
+        queue = self._queues.get(gid)
+        if queue is None:
+            queue = self._queues[gid] = asyncio.Queue(self.queue_size)
+        try:
+            queue.put_nowait((handler, kwargs))
+        except asyncio.QueueFull:
+            return False
+        if gid not in self._drains:
+            self._drains[gid] = asyncio.ensure_future(self._drain(gid, queue))
+        return True
+
+    def should_warn(self, uid: int, now: float = None) -> bool:
+        """
+        Whether a user whose command was turned away should be told, at most once per period. The rest are dropped
+        silently, so replying can't double the traffic the limit is there to cut.
+        """
+        now = time.monotonic() if now is None else now
+        period = self.limiter.period
+        if now - self._warned.get(uid, now - period) < period:
+            return False
+        self._warned[uid] = now
+        if len(self._warned) > 4096:
+            self._warned = {uid: last for uid, last in self._warned.items() if now - last < period}
+        return True
+
+    async def close(self):
+        """
+        Waits for every queued command to finish.
+        """
+        while self._drains:
+            await asyncio.gather(*self._drains.values())
+
+    async def _drain(self, gid: int, queue: asyncio.Queue):
+        try:
+            while not queue.empty():
+                handler, kwargs = queue.get_nowait()
+                async with self._semaphore:
+                    await self._run(handler, kwargs)
+        finally:
+            del self._drains[gid]
+            if queue.empty():
+                del self._queues[gid]
+
+    @staticmethod
+    async def _run(handler: callable, kwargs: dict):
+        try:
+            await handler(**kwargs)
+        except Exception as e:  # one failing command shouldn't take the guild's queue down with it
+            print(f'Command {handler.__name__} failed: {e!r}')
@@ -1,6 +1,217 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from server import snapshot
+from server.snapshot import INT, INTS, STR
+
 
 class Player(object):
-    pass
+    def __init__(self, uid: int = None, name: str = '', score: int = 0):
+        """
+        :param uid: the Discord user id of the player.
+        :param name: the player's display name.
+        :param score: the player's ranking score.
+        """
+        self.uid = uid
+        self.name = name
+        self.score = score
+
 
 class Game(object):
-    pass
\ No newline at end of file
+    def __init__(self, gid: int = None, players: [int] = None):
+        """
+        :param gid: the id of the game, unique among active games.
+        :param players: the Discord user ids of the players in the game.
+        """
+        self.gid = gid
+        self.players = players or []
+
+    def step(self, dt: float):
+        """
+        Advances the game by one tick. Runs in a GameEngine worker process, which streams back every attribute given a
+        new value here, so change state by assigning attributes rather than mutating them in place.
+        :param dt: length of the tick in seconds.
+        """
+        pass
+
+
+snapshot.register(Player, 1, 1, [('uid', INT), ('name', STR), ('score', INT)])
+snapshot.register(Game, 2, 1, [('gid', INT), ('players', INTS)])
+
+
+class Repository(object):
+    """
+    A table of records (players, games, ...) in a local SQLite database.
+    Reads go through an in-memory LRU cache, writes are queued and written behind in batches on a worker thread, so
+    neither startup time nor resident memory grow with the number of stored records.
+    """
+
+    def __init__(self, path: Path, table: str, key: str, indexed: (str,) = (), cache_size: int = 4096,
+                 flush_interval: float = 1.0):
+        """
+        :param path: the SQLite database file, created if missing.
+        :param table: name of the table the records are kept in.
+        :param key: the integer attribute of a record that identifies it, used as the primary key.
+        :param indexed: other attributes of a record copied into their own indexed columns, so they can be queried.
+        :param cache_size: most records kept in the LRU cache.
+        :param flush_interval: seconds between write-behind batches.
+        """
+        self.path = Path(path)
+        self.table = table
+        self.key = key
+        self.indexed = tuple(indexed)
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self._cache: OrderedDict = OrderedDict()
+        self._pending: {int: (object, tuple)} = {}  # key: (record, row to write)
+        self._in_flight: {int: (object, tuple)} = {}  # the batch being written right now
+        self._lock = threading.Lock()
+        self._flushed = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self._closed = False
+        self._error: Exception = None  # why the last batch couldn't be written, raised by the next flush
+
+        self._reader = self._connect()
+        columns = ''.join(f', {column}' for column in self.indexed)
+        self._reader.execute(f'CREATE TABLE IF NOT EXISTS {table} ({key} INTEGER PRIMARY KEY{columns}, data BLOB)')
+        for column in self.indexed:
+            self._reader.execute(f'CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})')
+        self._reader.commit()
+        self._insert = f'INSERT OR REPLACE INTO {table} ({", ".join((key,) + self.indexed)}, data) ' \
+                       f'VALUES ({", ".join("?" * (len(self.indexed) + 2))})'
+        self._writer = threading.Thread(target=self._write_behind, name=f'Repository-{table}', daemon=True)
+        self._writer.start()
+
+    def __len__(self):
+        return self.query(f'SELECT COUNT(*) FROM {self.table}')[0][0]
+
+    def __contains__(self, key: int):
+        return self.get(key) is not None
+
+    def get(self, key: int):
+        """
+        Gives the record with the given key, or None if there isn't one.
+        """
+        record = self._cache.get(key)
+        if record is not None:
+            self._cache.move_to_end(key)
+            return record
+        with self._lock:
+            queued = self._pending.get(key) or self._in_flight.get(key)
+            if queued is None:
+                row = self._reader.execute(f'SELECT data FROM {self.table} WHERE {self.key} = ?', (key,)).fetchone()
+        if queued is not None:
+            record = queued[0]
+        elif row is None:
+            return None
+        else:
+            record = snapshot.decode(row[0])
+        self._remember(key, record)
+        return record
+
+    def upsert(self, record):
+        """
+        Queues a new or changed record to be written. It is readable through get straight away.
+        The record is serialized now, so later changes to it need another upsert.
+        """
+        key = getattr(record, self.key)
+        row = self._row(key, record)
+        self._remember(key, record)
+        with self._lock:
+            self._pending[key] = (record, row)
+            backlog = len(self._pending)
+        if backlog >= 1024:
+            self._wake.set()
+
+    def bulk_upsert(self, records):
+        """
+        Queues many new or changed records to be written in one batch.
+        """
+        queued = {}
+        for record in records:
+            key = getattr(record, self.key)
+            queued[key] = (record, self._row(key, record))
+        with self._lock:
+            self._pending.update(queued)
+        self._wake.set()
+
+    def query(self, sql: str, parameters: tuple = ()) -> [tuple]:
+        """
+        Runs a read-only query against the table's indexed columns, e.g. for rankings. Queued writes are flushed first.
+        """
+        self.flush()
+        with self._lock:
+            return self._reader.execute(sql, parameters).fetchall()
+
+    def flush(self):
+        """
+        Blocks until every queued write is on disk.
+        :raises sqlite3.Error: if writing failed, the writes stay queued and are tried again.
+        """
+        with self._lock:
+            while (self._pending or self._in_flight) and not self._closed:
+                if self._error is not None:
+                    error, self._error = self._error, None
+                    raise error
+                self._wake.set()
+                self._flushed.wait()
+
+    def close(self):
+        """
+        Writes anything still queued and closes the database.
+        """
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self._closed = True
+            self._wake.set()
+            self._writer.join()
+            self._reader.close()
+
+    def _remember(self, key: int, record):
+        cache = self._cache
+        cache[key] = record
+        cache.move_to_end(key)
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def _row(self, key: int, record) -> tuple:
+        return (key,) + tuple(getattr(record, column) for column in self.indexed) + (snapshot.encode(record),)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Shared between threads, every use is guarded by self._lock or owned by the writer thread.
+        connection = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _write_behind(self):
+        connection = self._connect()
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            with self._lock:
+                batch = self._in_flight = self._pending
+                self._pending = {}
+                closed = self._closed
+            try:
+                if batch:
+                    with connection:
+                        connection.executemany(self._insert, [row for _, row in batch.values()])
+                    self._error = None
+            except Exception as e:  # keep the batch for the next try, writes queued since then are newer
+                print(f'Could not write {len(batch)} {self.table}: {e!r}')
+                with self._lock:
+                    batch.update(self._pending)
+                    self._pending = batch
+                    self._error = e
+            finally:
+                with self._lock:
+                    self._in_flight = {}
+                    self._flushed.notify_all()
+            if closed:
+                break
+        connection.close()
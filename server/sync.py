@@ -0,0 +1,176 @@
+"""
+Streams entity state to game clients with the protocol in common.protocol.
+
+Run on its own it is a loopback stand-in for the game server, serving entities that walk in circles so the client's
+sync and interpolation can be tried without Discord:
+
+    python -m server.sync --entities 20 --rate 60
+    python -m server.sync --entities 20 --rate 60 --bench 5
+
+With --bench it also connects its own client and reports the bytes per second each client receives.
+
+The Discord controller doesn't start a SyncServer: its Games only hold their players so far, there are no positions or
+health to stream. Once Game.step moves entities, the controller can serve them by passing a source that reads them from
+active_games, which the GameEngine keeps current.
+"""
+import argparse
+import asyncio
+import math
+import time
+
+from common.protocol import LENGTH, ProtocolError, StateDecoder, StateEncoder, frame, quantize
+
+
+class _Connection(object):
+    __slots__ = ('writer', 'encoder')
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.encoder = StateEncoder()
+
+
+class SyncServer(object):
+    """
+    Sends every connected client the state of every entity at a fixed rate, as a snapshot followed by deltas.
+    """
+
+    def __init__(self, source: callable, host: str = '127.0.0.1', port: int = 7777, rate: float = 30,
+                 max_buffer: int = 64 * 1024):
+        """
+        :param source: called once per update, gives {entity id: (x, y, health)} in relative units. Ids are 16 bit.
+        :param rate: updates per second.
+        :param max_buffer: bytes a client may have waiting to be sent before it is skipped for an update. Skipped
+        updates cost nothing to catch up on, the next delta covers everything since the last one sent.
+        """
+        self.source = source
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.max_buffer = max_buffer
+        self.bytes_sent = 0
+        self.clients: {_Connection} = set()
+        self._handlers: {asyncio.Task} = set()
+        self._server: asyncio.AbstractServer = None
+        self._broadcast: asyncio.Task = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._accept, self.host, self.port)
+        if not self.port:
+            self.port = self._server.sockets[0].getsockname()[1]
+        self._broadcast = asyncio.ensure_future(self._run())
+
+    async def close(self):
+        self._broadcast.cancel()
+        self._server.close()
+        for client in list(self.clients):
+            client.writer.close()
+        if self._handlers:
+            await asyncio.wait(self._handlers)
+        await self._server.wait_closed()
+
+    def update(self):
+        """
+        Sends one update to every client.
+        """
+        if not self.clients:
+            return
+        states = {eid: quantize(*state) for eid, state in self.source().items()}
+        for client in list(self.clients):
+            writer = client.writer
+            if writer.is_closing():
+                self.clients.discard(client)
+                continue
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                continue
+            try:
+                data = frame(client.encoder.encode(states))
+            except ProtocolError as e:  # the client keeps its baseline and gets the next update that fits
+                print(f'Skipped an update: {e}')
+                continue
+            writer.write(data)
+            self.bytes_sent += len(data)
+
+    async def _run(self):
+        interval = 1 / self.rate
+        next_update = time.perf_counter()
+        while True:
+            try:
+                self.update()
+            except Exception as e:  # one bad tick shouldn't stop every client's updates
+                print(f'Sync update failed: {e!r}')
+            next_update = max(next_update + interval, time.perf_counter())
+            await asyncio.sleep(next_update - time.perf_counter())
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = _Connection(writer)
+        self.clients.add(client)
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        try:
+            # Clients don't send anything yet, this only notices when they hang up.
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self._handlers.discard(handler)
+            self.clients.discard(client)
+            writer.close()
+
+
+async def read_states(reader: asyncio.StreamReader, decoder: StateDecoder = None):
+    """
+    Yields the full entity state after each frame read from a server, until the connection closes.
+    """
+    decoder = decoder or StateDecoder()
+    while True:
+        try:
+            header = await reader.readexactly(LENGTH.size)
+            payload = await reader.readexactly(LENGTH.unpack(header)[0])
+        except asyncio.IncompleteReadError:
+            return
+        yield decoder.decode(payload)
+
+
+def _walkers(count: int) -> callable:
+    """
+    Entities walking in circles around the screen, losing health as they go.
+    """
+    start = time.perf_counter()
+
+    def source():
+        t = time.perf_counter() - start
+        return {eid: (8 + 6 * math.cos(t + eid), 4.5 + 3.5 * math.sin(t * 1.3 + eid), 100 - int(t + eid) % 100)
+                for eid in range(count)}
+
+    return source
+
+
+async def _main(arguments: argparse.Namespace):
+    server = SyncServer(_walkers(arguments.entities), arguments.host, arguments.port, arguments.rate)
+    await server.start()
+    print(f'Serving {arguments.entities} entities at {arguments.rate} Hz on {server.host}:{server.port}')
+    if not arguments.bench:
+        await asyncio.Event().wait()
+    reader, writer = await asyncio.open_connection(server.host, server.port)
+    frames = 0
+    start = time.perf_counter()
+    async for _ in read_states(reader):
+        frames += 1
+        if time.perf_counter() - start >= arguments.bench:
+            break
+    elapsed = time.perf_counter() - start
+    writer.close()
+    await server.close()
+    print(f'{frames / elapsed:.1f} frames/s, {server.bytes_sent / elapsed:.0f} bytes/s per client, '
+          f'{server.bytes_sent / max(frames, 1):.1f} bytes/frame')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--entities', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=30)
+    parser.add_argument('--bench', type=float, default=0, help='seconds to measure bandwidth for, then exit')
+    asyncio.run(_main(parser.parse_args()))